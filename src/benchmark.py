@@ -0,0 +1,534 @@
+"""
+Offline micro-benchmarks for the recommender engine.
+
+Usage:
+    python src/benchmark.py ann --n 200000
+    python src/benchmark.py retrieval --n 100000
+    python src/benchmark.py constraints --n 100000
+    python src/benchmark.py batch --personas 1000
+    python src/benchmark.py prompt --candidates 100
+    python src/benchmark.py rerank --sizes 10 20 30 50
+    python src/benchmark.py startup
+    python src/benchmark.py memory --n 200000
+    python src/benchmark.py docs --sizes 10000 100000 1000000
+    python src/benchmark.py quantized --n 200000
+"""
+import argparse
+import json
+import time
+import numpy as np
+
+from config import RECIPES_FILE, PERSONAS_FILE, EMBEDDING_CACHE_FILE, CONSIDERATION_SET_SIZE
+from vector_index import l2_normalize
+
+
+def load_or_synthesize_embeddings(n: int, dim: int = 384, seed: int = 0) -> np.ndarray:
+    """
+    Uses the cached recipe embeddings when available (tiled with noise up to `n` rows),
+    otherwise a clustered synthetic catalog with the same dimensionality as gte-small.
+    """
+    rng = np.random.default_rng(seed)
+    if EMBEDDING_CACHE_FILE.exists():
+        base = np.load(EMBEDDING_CACHE_FILE, mmap_mode="r")["vector"]
+        print(f"Seeding from {len(base)} cached recipe embeddings.")
+    else:
+        base = rng.standard_normal((64, dim)).astype(np.float32)
+        print("No embedding cache found; using a synthetic clustered catalog.")
+    picks = rng.integers(0, len(base), size=n)
+    noise = rng.standard_normal((n, base.shape[1])).astype(np.float32)
+    embeddings = base[picks] + 0.5 * np.linalg.norm(base, axis=1).mean() / np.sqrt(base.shape[1]) * noise
+    return l2_normalize(embeddings)
+
+
+def _time_searches(index, queries, masks, k):
+    latencies, results = [], []
+    for q, m in zip(queries, masks):
+        start = time.perf_counter()
+        rows, _ = index.search(q, k, m)
+        latencies.append(time.perf_counter() - start)
+        results.append(rows)
+    return np.array(latencies) * 1000, results
+
+
+def bench_ann(args):
+    from vector_index import FlatIndex, IVFIndex
+
+    k = CONSIDERATION_SET_SIZE
+    embeddings = load_or_synthesize_embeddings(args.n)
+    rng = np.random.default_rng(1)
+    queries = embeddings[rng.integers(0, len(embeddings), size=args.queries)]
+    queries = queries + 0.1 * rng.standard_normal(queries.shape).astype(np.float32)
+    # Half the queries are unfiltered, half use a random ~50% hard-constraint mask
+    masks = [None if i % 2 == 0 else rng.random(len(embeddings)) < 0.5 for i in range(args.queries)]
+
+    flat = FlatIndex(embeddings)
+    exact_ms, exact = _time_searches(flat, queries, masks, k)
+
+    start = time.perf_counter()
+    ivf = IVFIndex(embeddings)
+    print(f"\nCatalog: {args.n} x {embeddings.shape[1]}, {args.queries} queries, k={k}")
+    print(f"IVF build: {time.perf_counter() - start:.1f}s ({ivf.n_lists} lists)\n")
+
+    print(f"{'index':<14}{'recall@' + str(k):>12}{'mean ms':>10}{'p95 ms':>10}")
+    print(f"{'flat':<14}{1.0:>12.3f}{exact_ms.mean():>10.2f}{np.percentile(exact_ms, 95):>10.2f}")
+    for n_probe in args.n_probe:
+        ivf.n_probe = n_probe
+        ms, approx = _time_searches(ivf, queries, masks, k)
+        recall = np.mean([len(np.intersect1d(a, e)) / max(1, len(e)) for a, e in zip(approx, exact)])
+        print(f"{'ivf/' + str(n_probe):<14}{recall:>12.3f}{ms.mean():>10.2f}{np.percentile(ms, 95):>10.2f}")
+
+
+def bench_retrieval(args):
+    """Legacy stage-1 path (cosine_similarity + DataFrame.nlargest) vs pre-normalized FlatIndex."""
+    import pandas as pd
+    from sklearn.metrics.pairwise import cosine_similarity
+    from vector_index import FlatIndex
+
+    k = CONSIDERATION_SET_SIZE
+    embeddings = load_or_synthesize_embeddings(args.n)
+    catalog = pd.DataFrame({"recipe_id": np.arange(args.n).astype(str), "title": "x"})
+    rng = np.random.default_rng(1)
+    queries = rng.standard_normal((args.queries, embeddings.shape[1])).astype(np.float32)
+    mask = rng.random(args.n) < 0.6
+    flat = FlatIndex(embeddings)
+
+    legacy_ms, fast_ms, identical = [], [], 0
+    for q in queries:
+        start = time.perf_counter()
+        safe = catalog[mask].copy()
+        safe["similarity_score"] = cosine_similarity(q.reshape(1, -1), embeddings[safe.index])[0]
+        legacy = safe.nlargest(k, "similarity_score")
+        legacy_ms.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        rows, scores = flat.search(q, k, mask)
+        fast = catalog.iloc[rows].assign(similarity_score=scores)
+        fast_ms.append(time.perf_counter() - start)
+        identical += list(legacy.index) == list(fast.index)
+
+    legacy_ms, fast_ms = np.array(legacy_ms) * 1000, np.array(fast_ms) * 1000
+    print(f"\nCatalog: {args.n} x {embeddings.shape[1]}, {args.queries} queries, k={k}")
+    print(f"legacy (cosine_similarity + nlargest): {legacy_ms.mean():8.2f} ms/query")
+    print(f"flat   (dot + argpartition):           {fast_ms.mean():8.2f} ms/query")
+    print(f"speed-up: {legacy_ms.mean() / fast_ms.mean():.1f}x, identical rankings: {identical}/{args.queries}")
+
+
+# Representative dietary profiles, used when no personas file has been generated yet
+SAMPLE_DIET_PROFILES = [
+    ([], []),
+    (["Peanuts"], ["Vegan"]),
+    (["Shellfish", "Tree nuts"], []),
+    (["Dairy", "Eggs"], ["Vegetarian"]),
+    (["Soy"], ["Gluten-Free"]),
+    (["milk", "egg", "wheat"], ["Vegan", "Gluten-Free"]),
+]
+
+
+def load_sample_profiles() -> list:
+    if PERSONAS_FILE.exists():
+        with open(PERSONAS_FILE, 'r') as f:
+            return [p['profile'] for p in json.load(f)]
+    return [
+        {
+            "dietary_goal": "Maintenance",
+            "likedIngredients": [], "dislikedIngredients": [], "favoriteCuisines": [],
+            "dietaryProfile": {
+                "foodAllergies": {"selected": allergies, "other": ""},
+                "dietaryRestrictions": {"selected": restrictions, "other": ""},
+                "healthConditions": {"selected": [], "other": ""},
+            },
+        }
+        for allergies, restrictions in SAMPLE_DIET_PROFILES
+    ]
+
+
+def load_scaled_catalog(n: int, unique_lists: bool = False):
+    """
+    The real recipe catalog tiled up to `n` rows (with unique ids). With `unique_lists`,
+    each copy's ingredient lists get a suffix so no two rows share the same list.
+    """
+    import pandas as pd
+    base = pd.read_parquet(RECIPES_FILE)
+    reps = int(np.ceil(n / len(base)))
+    catalog = pd.concat([base] * reps, ignore_index=True).iloc[:n].copy()
+    catalog['recipe_id'] = np.arange(len(catalog)).astype(str)
+    if unique_lists:
+        copy_no = np.arange(len(catalog)) // len(base)
+        catalog['ingredients_title'] = [
+            np.array([f"{items[0]} {c}", *items[1:]], dtype=object) if c and len(items) else items
+            for items, c in zip(catalog['ingredients_title'], copy_no)
+        ]
+    return catalog
+
+
+def bench_constraints(args):
+    """Legacy per-request string scan vs precomputed ConstraintIndex masks."""
+    from constraint_index import ConstraintIndex, scan_hard_constraints
+
+    catalog = load_scaled_catalog(args.n)
+    profiles = load_sample_profiles()
+
+    start = time.perf_counter()
+    index = ConstraintIndex(catalog)
+    print(f"\nCatalog: {len(catalog)} recipes, {len(profiles)} profiles")
+    print(f"Index build: {time.perf_counter() - start:.2f}s")
+
+    legacy_ms, cold_ms, warm_ms, identical = [], [], [], 0
+    for profile in profiles:
+        diet = profile['dietaryProfile']
+        allergies, restrictions = diet['foodAllergies']['selected'], diet['dietaryRestrictions']['selected']
+
+        start = time.perf_counter()
+        legacy = scan_hard_constraints(catalog, profile)
+        legacy_ms.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        mask = index.safe_mask(allergies, restrictions)
+        cold_ms.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        index.safe_mask(allergies, restrictions)
+        warm_ms.append(time.perf_counter() - start)
+
+        identical += np.array_equal(np.flatnonzero(mask), legacy.index.to_numpy())
+
+    print(f"legacy scan:          {np.mean(legacy_ms) * 1000:9.3f} ms/profile")
+    print(f"index (first use):    {np.mean(cold_ms) * 1000:9.3f} ms/profile")
+    print(f"index (cached terms): {np.mean(warm_ms) * 1000:9.3f} ms/profile")
+    print(f"identical safe sets: {identical}/{len(profiles)}")
+
+
+def bench_batch(args):
+    """Per-persona FlatIndex.search vs one search_batch call per safe-set group."""
+    from vector_index import FlatIndex
+
+    k = CONSIDERATION_SET_SIZE
+    embeddings = load_or_synthesize_embeddings(args.n)
+    rng = np.random.default_rng(1)
+    queries = rng.standard_normal((args.personas, embeddings.shape[1])).astype(np.float32)
+    group_masks = [rng.random(args.n) < 0.6 for _ in range(args.groups)]
+    groups = rng.integers(0, args.groups, size=args.personas)
+    flat = FlatIndex(embeddings)
+
+    start = time.perf_counter()
+    single = [flat.search(q, k, group_masks[g]) for q, g in zip(queries, groups)]
+    single_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batched = [None] * args.personas
+    for g, mask in enumerate(group_masks):
+        members = np.flatnonzero(groups == g)
+        for i, hit in zip(members, flat.search_batch(queries[members], k, mask)):
+            batched[i] = hit
+    batch_s = time.perf_counter() - start
+
+    identical = sum(np.array_equal(a[0], b[0]) for a, b in zip(single, batched))
+    overlap = np.mean([len(np.intersect1d(a[0], b[0])) / max(1, len(a[0])) for a, b in zip(single, batched)])
+    print(f"\nCatalog: {args.n} x {embeddings.shape[1]}, {args.personas} personas in {args.groups} safe-set groups")
+    print(f"one query at a time: {single_s:7.2f}s")
+    print(f"batched per group:   {batch_s:7.2f}s  ({single_s / batch_s:.1f}x)")
+    print(f"identical rankings: {identical}/{args.personas} (rest differ by float rounding), top-{k} overlap: {overlap:.4f}")
+
+
+def bench_prompt(args):
+    """Stage 2 input tokens per request: original indented JSON vs compact tabular prompt."""
+    import pandas as pd
+    from config import LLM_MODEL_NAME, PROMPT_MAX_INGREDIENTS
+    from prompt_encoding import build_compact_user_prompt, build_json_user_prompt, count_tokens, token_count_source
+
+    catalog = pd.read_parquet(RECIPES_FILE)
+    catalog['recipe_id'] = catalog['recipe_id'].astype(str)
+    profiles = load_sample_profiles()[:args.profiles]
+    rng = np.random.default_rng(0)
+
+    variants = {
+        "json": lambda p, c: build_json_user_prompt(p, c),
+        "compact": lambda p, c: build_compact_user_prompt(p, c, LLM_MODEL_NAME),
+        f"compact, {PROMPT_MAX_INGREDIENTS} ingr.": lambda p, c: build_compact_user_prompt(
+            p, c, LLM_MODEL_NAME, PROMPT_MAX_INGREDIENTS),
+    }
+    tokens = {name: [] for name in variants}
+    for profile in profiles:
+        candidates = catalog.iloc[rng.choice(len(catalog), args.candidates, replace=False)]
+        for name, build in variants.items():
+            prompt, _ = build(profile, candidates)
+            tokens[name].append(count_tokens(prompt, LLM_MODEL_NAME))
+
+    baseline = np.mean(tokens["json"])
+    print(f"\n{len(profiles)} profiles x {args.candidates} candidates, {token_count_source(LLM_MODEL_NAME)}")
+    for name, counts in tokens.items():
+        print(f"{name:<18} {np.mean(counts):9.0f} tokens/request  ({np.mean(counts) / baseline:.0%} of json)")
+
+
+def bench_rerank(args):
+    """
+    Local reranker: latency, Stage 2 prompt size and agreement with the LLM. Agreement is the
+    share of the LLM's final picks (from RECOMMENDATIONS_FILE, produced without reranking)
+    that survive the cut, vs simply keeping the top Stage 1 similarities.
+    """
+    from config import LLM_MODEL_NAME, RECOMMENDATIONS_FILE
+    from recommender import XFoodRecommender
+    from prompt_encoding import build_json_user_prompt, count_tokens, token_count_source
+
+    if PERSONAS_FILE.exists():
+        with open(PERSONAS_FILE, 'r') as f:
+            personas = json.load(f)[:args.personas]
+    else:
+        personas = [{"id": f"sample_{i}", "profile": p} for i, p in enumerate(load_sample_profiles())]
+    llm_picks = {}
+    if RECOMMENDATIONS_FILE.exists():
+        with open(RECOMMENDATIONS_FILE, 'r') as f:
+            llm_picks = {r['persona']['id']: {rec['recipe_id'] for rec in r['recommendations']} for r in json.load(f)}
+    else:
+        print(f"{RECOMMENDATIONS_FILE} not found: reporting latency and prompt size only.")
+
+    engine = XFoodRecommender(use_response_cache=False)
+    rows = {size: {"ms": [], "tokens": [], "kept": 0, "truncated": 0} for size in args.sizes}
+    full_tokens, n_picks = [], 0
+    for persona in personas:
+        profile = persona['profile']
+        candidates = engine.stage_1_retrieval(profile)
+        picks = llm_picks.get(persona['id'], set())
+        n_picks += len(picks)
+        full_tokens.append(count_tokens(build_json_user_prompt(profile, candidates)[0], LLM_MODEL_NAME))
+
+        for size, row in rows.items():
+            start = time.perf_counter()
+            kept = engine.local_rerank(profile, candidates, size)
+            row["ms"].append(time.perf_counter() - start)
+            row["tokens"].append(count_tokens(build_json_user_prompt(profile, kept)[0], LLM_MODEL_NAME))
+            row["kept"] += len(picks & set(kept['recipe_id']))
+            row["truncated"] += len(picks & set(candidates['recipe_id'].head(size)))
+
+    print(f"\n{len(personas)} personas, {len(candidates)} Stage 1 candidates, {np.mean(full_tokens):.0f} prompt tokens without reranking "
+          f"({token_count_source(LLM_MODEL_NAME)})")
+    print(f"{'size':>5} {'rerank ms':>10} {'prompt tokens':>14} {'LLM picks kept':>15} {'top-similarity':>15}")
+    for size, row in rows.items():
+        kept = f"{row['kept'] / n_picks:.1%}" if n_picks else "n/a"
+        truncated = f"{row['truncated'] / n_picks:.1%}" if n_picks else "n/a"
+        print(f"{size:>5} {np.mean(row['ms']) * 1000:>10.2f} {np.mean(row['tokens']):>14.0f} {kept:>15} {truncated:>15}")
+
+
+# Import-time budget (seconds) per script; heavy libraries and API clients must stay lazy
+STARTUP_BUDGETS = {
+    "create_ab_test": 0.5,
+    "json_to_csv": 0.5,
+    "json_to_html": 0.5,
+    "jsonl_to_json": 0.5,
+    "evaluator": 0.5,
+    "generate_personas": 0.5,
+    "recommender": 1.5,
+}
+
+
+def bench_startup(args):
+    """Import time of each script, measured with `python -X importtime` in a fresh interpreter."""
+    import sys
+    import subprocess
+    from pathlib import Path
+
+    src_dir = Path(__file__).parent
+    print(f"\n{'script':<20} {'import s':>9} {'budget s':>9}  slowest dependency")
+    for module, budget in STARTUP_BUDGETS.items():
+        runs = []
+        for _ in range(args.repeat):
+            proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                                  cwd=src_dir, capture_output=True, text=True)
+            if proc.returncode != 0:
+                break
+            # Lines: "import time: <self us> | <cumulative us> | <indented name>", children first
+            rows = [line.split("|") for line in proc.stderr.splitlines() if line.startswith("import time:")][1:]
+            rows = [(len(name) - len(name.lstrip()), name.strip(), int(cum)) for _, cum, name in rows]
+            end = next(i for i, row in enumerate(rows) if row[1] == module)
+            start = end
+            while start > 0 and rows[start - 1][0] > rows[end][0]:
+                start -= 1
+            # The module itself and its direct imports
+            runs.append({name: cum for depth, name, cum in rows[start:end + 1]
+                         if name == module or depth == rows[end][0] + 2})
+        if not runs:
+            print(f"{module:<20} {'failed':>9} {budget:>9.2f}  {proc.stderr.strip().splitlines()[-1]}")
+            continue
+
+        total = min(r[module] for r in runs) / 1e6
+        deps = {name: min(r.get(name, 0) for r in runs) for name in runs[0] if name != module}
+        slowest = max(deps, key=deps.get) if deps else "-"
+        status = "✅" if total <= budget else "⚠️"
+        print(f"{module:<20} {total:>9.3f} {budget:>9.2f}  {slowest} ({deps.get(slowest, 0) / 1e6:.3f}s) {status}")
+
+
+def _rss_mb() -> float:
+    """Current resident set size of this process in MB (Linux), else the peak RSS."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _measure_catalog_layout(layout: str, catalog_path: str):
+    """Runs in a fresh interpreter: loads the catalog as the engine did / does and prints RSS."""
+    import pandas as pd
+    from recipe_docs import create_recipe_doc, build_recipe_docs
+    from recommender import load_recipes, compact_recipe_layout, release_unused_memory
+
+    baseline = _rss_mb()
+    if layout == "legacy":
+        df = pd.read_parquet(catalog_path)
+        df['recipe_id'] = df['recipe_id'].astype(str)
+        df['semantic_doc'] = df.apply(create_recipe_doc, axis=1)
+    else:
+        df = load_recipes(catalog_path)
+        docs = build_recipe_docs(df)
+        df = compact_recipe_layout(df)
+        del docs
+    release_unused_memory()
+    try:  # Hand freed heap pages back to the OS so RSS reflects live data (glibc only)
+        import ctypes
+        ctypes.CDLL("libc.so.6").malloc_trim(0)
+    except (OSError, AttributeError):
+        pass
+    print(json.dumps({"rss_mb": _rss_mb() - baseline, "frame_mb": df.memory_usage(deep=True).sum() / 2**20}))
+
+
+def bench_memory(args):
+    """Resident memory of the loaded catalog: full read + semantic_doc column vs projected compact layout."""
+    import sys
+    import subprocess
+    import tempfile
+    from pathlib import Path
+
+    if args.layout:
+        _measure_catalog_layout(args.layout, args.catalog)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        catalog_path = Path(tmp) / "catalog.parquet"
+        load_scaled_catalog(args.n).to_parquet(catalog_path)
+        print(f"\nSynthetic catalog: {args.n} recipes (real catalog tiled)")
+        print(f"{'layout':<10} {'RSS MB':>9} {'DataFrame MB':>13}")
+        for layout in ["legacy", "compact"]:
+            proc = subprocess.run(
+                [sys.executable, __file__, "memory", "--layout", layout, "--catalog", str(catalog_path)],
+                cwd=Path(__file__).parent, capture_output=True, text=True
+            )
+            if proc.returncode != 0:
+                print(f"{layout:<10} failed: {proc.stderr.strip().splitlines()[-1]}")
+                continue
+            result = json.loads(proc.stdout.strip().splitlines()[-1])
+            print(f"{layout:<10} {result['rss_mb']:>9.0f} {result['frame_mb']:>13.0f}")
+
+
+def bench_docs(args):
+    """Embedding document texts: per-row DataFrame.apply vs the column-wise builder."""
+    from recipe_docs import create_recipe_doc, build_recipe_docs
+
+    print(f"\n{'rows':>9} {'apply s':>9} {'column-wise s':>14} {'speedup':>8}  identical")
+    for n in args.sizes:
+        catalog = load_scaled_catalog(n, unique_lists=True)
+
+        start = time.perf_counter()
+        legacy = catalog.apply(create_recipe_doc, axis=1).tolist()
+        legacy_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        docs = build_recipe_docs(catalog)
+        fast_s = time.perf_counter() - start
+
+        print(f"{n:>9} {legacy_s:>9.2f} {fast_s:>14.2f} {legacy_s / fast_s:>7.1f}x  {docs == legacy}")
+
+
+def bench_quantized(args):
+    """float16 / int8 embedding storage vs float32: memory, latency, top-k overlap."""
+    from vector_index import FlatIndex, QuantizedFlatIndex
+
+    k = CONSIDERATION_SET_SIZE
+    embeddings = load_or_synthesize_embeddings(args.n)
+    rng = np.random.default_rng(1)
+    queries = embeddings[rng.integers(0, len(embeddings), size=args.queries)]
+    queries = queries + 0.1 * rng.standard_normal(queries.shape).astype(np.float32)
+    masks = [None if i % 2 == 0 else rng.random(len(embeddings)) < 0.5 for i in range(args.queries)]
+
+    flat = FlatIndex(embeddings)
+    exact_ms, exact = _time_searches(flat, queries, masks, k)
+
+    print(f"\nCatalog: {args.n} x {embeddings.shape[1]}, {args.queries} queries, k={k}")
+    print(f"{'storage':<18}{'RAM MB':>9}{'build s':>9}{'mean ms':>9}{'top-k overlap':>15}{'identical':>11}")
+    print(f"{'float32':<18}{embeddings.nbytes / 2**20:>9.1f}{0:>9.2f}{exact_ms.mean():>9.2f}{1.0:>15.4f}{args.queries:>11}")
+    for quantization in ["float16", "int8"]:
+        for rescore in [False, True]:
+            start = time.perf_counter()
+            index = QuantizedFlatIndex(embeddings, quantization, rescore=rescore, rescore_factor=args.rescore_factor)
+            build_s = time.perf_counter() - start
+            ms, approx = _time_searches(index, queries, masks, k)
+            overlap = np.mean([len(np.intersect1d(a, e)) / max(1, len(e)) for a, e in zip(approx, exact)])
+            identical = sum(np.array_equal(a, e) for a, e in zip(approx, exact))
+            name = quantization + (f" +rescore x{args.rescore_factor}" if rescore else "")
+            print(f"{name:<18}{index.nbytes / 2**20:>9.1f}{build_s:>9.2f}{ms.mean():>9.2f}{overlap:>15.4f}{identical:>11}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    ann = sub.add_parser("ann", help="Recall@CONSIDERATION_SET_SIZE vs latency: IVF vs exact flat index")
+    ann.add_argument("--n", type=int, default=100_000, help="Catalog size")
+    ann.add_argument("--queries", type=int, default=50)
+    ann.add_argument("--n-probe", type=int, nargs="+", default=[1, 4, 8, 16, 32])
+    ann.set_defaults(func=bench_ann)
+
+    retrieval = sub.add_parser("retrieval", help="Stage-1 latency: legacy sklearn path vs pre-normalized flat index")
+    retrieval.add_argument("--n", type=int, default=100_000, help="Catalog size")
+    retrieval.add_argument("--queries", type=int, default=20)
+    retrieval.set_defaults(func=bench_retrieval)
+
+    constraints = sub.add_parser("constraints", help="Hard-constraint filtering: legacy string scan vs ConstraintIndex")
+    constraints.add_argument("--n", type=int, default=100_000, help="Catalog size (real recipes, tiled)")
+    constraints.set_defaults(func=bench_constraints)
+
+    batch = sub.add_parser("batch", help="Stage-1 retrieval: per-persona queries vs batched matrix-matrix search")
+    batch.add_argument("--n", type=int, default=50_000, help="Catalog size")
+    batch.add_argument("--personas", type=int, default=1000)
+    batch.add_argument("--groups", type=int, default=8, help="Distinct safe sets among the personas")
+    batch.set_defaults(func=bench_batch)
+
+    prompt = sub.add_parser("prompt", help="Stage-2 prompt size: original JSON vs compact candidate encoding")
+    prompt.add_argument("--candidates", type=int, default=CONSIDERATION_SET_SIZE)
+    prompt.add_argument("--profiles", type=int, default=20)
+    prompt.set_defaults(func=bench_prompt)
+
+    rerank = sub.add_parser("rerank", help="Local reranker before Stage 2: latency, prompt size, agreement with the LLM")
+    rerank.add_argument("--sizes", type=int, nargs="+", default=[10, 20, 30, 50])
+    rerank.add_argument("--personas", type=int, default=100)
+    rerank.set_defaults(func=bench_rerank)
+
+    startup = sub.add_parser("startup", help="Per-script import time vs budget (python -X importtime)")
+    startup.add_argument("--repeat", type=int, default=3, help="Best of N fresh interpreters")
+    startup.set_defaults(func=bench_startup)
+
+    memory = sub.add_parser("memory", help="Catalog memory: full read + doc column vs projected compact layout")
+    memory.add_argument("--n", type=int, default=200_000, help="Catalog size (real recipes, tiled)")
+    memory.add_argument("--layout", choices=["legacy", "compact"], help=argparse.SUPPRESS)
+    memory.add_argument("--catalog", help=argparse.SUPPRESS)
+    memory.set_defaults(func=bench_memory)
+
+    docs = sub.add_parser("docs", help="Embedding document construction: row-wise apply vs column-wise builder")
+    docs.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    docs.set_defaults(func=bench_docs)
+
+    quantized = sub.add_parser("quantized", help="float16/int8 embedding storage vs float32: memory, latency, top-k overlap")
+    quantized.add_argument("--n", type=int, default=200_000, help="Catalog size")
+    quantized.add_argument("--queries", type=int, default=50)
+    quantized.add_argument("--rescore-factor", type=int, default=4)
+    quantized.set_defaults(func=bench_quantized)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
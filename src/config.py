@@ -19,6 +19,11 @@ OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
 RECIPES_FILE = INPUT_DIR / "recipes.parquet"  
 PERSONAS_FILE = OUTPUT_DIR / "personas.json"
 RECOMMENDATIONS_FILE = OUTPUT_DIR / "recommendations.json"
+RECOMMENDATIONS_STREAM_FILE = OUTPUT_DIR / "recommendations.jsonl"  # Per-persona checkpoint log
+QUERY_CACHE_FILE = OUTPUT_DIR / "query_embeddings.npz"  # Persisted user-query embeddings
+LLM_CACHE_FILE = OUTPUT_DIR / "llm_cache.sqlite"  # Stage 2 response cache
+EMBEDDING_CACHE_FILE = INPUT_DIR / "recipes.embeddings.npy"  # Content-addressed cache (see embedding_store.py)
+VECTOR_INDEX_FILE = INPUT_DIR / "recipes.ivf.npz"  # Persisted ANN index (only used when VECTOR_INDEX_TYPE == "ivf")
 
 # --- Model Settings ---
 EMBEDDING_MODEL_NAME = "thenlper/gte-small"
@@ -26,4 +31,47 @@ LLM_MODEL_NAME = "gpt-4o"  # or "gpt-5.2"
 
 # --- Parameters ---
 CONSIDERATION_SET_SIZE = 100  # Number of candidates sent to Stage 2
-FINAL_K = 6                  # Number of final recommendations
\ No newline at end of file
+FINAL_K = 6                  # Number of final recommendations
+STAGE1_BATCH_SIZE = 256      # Personas retrieved together in one batched Stage 1 pass
+DISLIKED_PENALTY_WEIGHT = 0.05  # Subtracted from a recipe's Stage 1 similarity per disliked ingredient it contains (0 = off)
+CATALOG_COMPACT_FRACTION = 0.2  # Deleted recipes are dropped from memory once they exceed this share of the catalog
+
+# --- Local reranking between Stage 1 and Stage 2 (CPU only, see reranker.py) ---
+LOCAL_RERANK_SIZE = None     # Candidates kept for the LLM, e.g. 20 (None = send all CONSIDERATION_SET_SIZE)
+LOCAL_RERANK_WEIGHTS = {
+    "similarity": 1.0,       # Stage 1 cosine similarity (z-scored)
+    "nutrition": 0.5,        # Macros vs dietary_goal (z-scored)
+    "liked": 0.5,            # Per liked ingredient present
+    "disliked": -1.0,        # Per disliked ingredient present
+    "cuisine": 0.5,          # Favourite cuisine in title/ingredients
+}
+
+# --- Stage 2 LLM calls (match these to your OpenAI rate-limit tier) ---
+LLM_MAX_CONCURRENCY = 8             # Parallel Stage 2 requests in run_batch
+LLM_REQUESTS_PER_MINUTE = 500
+LLM_TOKENS_PER_MINUTE = 450_000
+LLM_MAX_OUTPUT_TOKENS_ESTIMATE = 800  # Reserved per request for the completion
+LLM_MAX_RETRIES = 5                 # On 429 / 5xx / connection errors
+LLM_BACKOFF_BASE_SECONDS = 1.0      # Exponential backoff: base * 2^attempt (jittered)
+LLM_BACKOFF_MAX_SECONDS = 60.0
+
+# --- Stage 2 prompt encoding ---
+PROMPT_FORMAT = "json"         # "json" (indented records, original) or "compact" (tabular rows, short aliases)
+PROMPT_MAX_INGREDIENTS = 12    # compact only: ingredients listed per candidate (None = all)
+PROMPT_TOKEN_BUDGET = None     # compact only: max tokens of the user message; lowest-ranked candidates are dropped (None = no limit)
+
+# --- Vector Index ---
+VECTOR_INDEX_TYPE = "flat"   # "flat" (exact), "ivf" (approximate, for large catalogs) or "quantized" (compact exact scan)
+IVF_N_LISTS = None           # Number of IVF buckets (None = sqrt(#recipes))
+IVF_N_PROBE = 8              # Buckets scanned per query; higher = better recall, slower
+QUANTIZATION = "int8"        # "quantized" only: "float16" (1/2 of float32 RAM) or "int8" (~1/4)
+QUANTIZED_RESCORE = True     # "quantized" only: re-rank the best hits with the float32 vectors
+RESCORE_FACTOR = 4           # ... taking CONSIDERATION_SET_SIZE * RESCORE_FACTOR approximate hits
+
+# --- Caches ---
+SAFE_SET_CACHE_SIZE = 256    # Distinct dietary profiles whose safe sets are memoized
+QUERY_CACHE_SIZE = 10_000    # User query texts whose embeddings are memoized
+QUERY_CACHE_PERSIST = True   # Reload/save the query cache (QUERY_CACHE_FILE) across runs
+LLM_CACHE_ENABLED = True     # Reuse Stage 2 responses for identical (model, prompt, profile, candidates)
+LLM_CACHE_TTL_SECONDS = 30 * 24 * 3600
+LLM_CACHE_MAX_ENTRIES = 50_000
\ No newline at end of file
@@ -0,0 +1,319 @@
+import re
+import itertools
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Optional
+
+WORD_RE = re.compile(r"\w+")
+# ASCII fast path for WORD_RE tokenization: every ASCII non-word character becomes a space
+_ASCII_NON_WORD = str.maketrans({
+    chr(i): ' ' for i in range(128) if not (chr(i).isalnum() or chr(i) == '_')
+})
+
+# "<food> oil" is not the food itself for liked/disliked ingredient matching
+PRESSED_OIL = 'oil'
+
+# Ingredient pattern that disqualifies a recipe for gluten-free users unless it is tagged 'gluten'
+GLUTEN_INGREDIENTS = 'flour|wheat|bread'
+
+
+def restriction_rule(restriction: str) -> Optional[str]:
+    """Maps a user restriction to the dataset rule it triggers (simple mapping logic)."""
+    restriction = restriction.lower()
+    if 'vegan' in restriction:
+        return 'vegan'
+    elif 'vegetarian' in restriction:
+        return 'vegetarian'
+    elif 'gluten' in restriction:
+        return 'gluten'
+    return None
+
+
+def preference_term(ingredient: str) -> str:
+    """
+    Normalized liked/disliked ingredient: lowercased and naively singularized, so that
+    'Mushrooms' and 'mushroom' are the same preference and 'Tomatoes' becomes 'tomato'.
+    """
+    term = ingredient.strip().lower()
+    if len(term) > 4 and term.endswith('ies'):
+        return term[:-3] + 'y'
+    if len(term) > 4 and term.endswith('oes'):
+        return term[:-2]
+    if len(term) > 3 and term.endswith('s') and not term.endswith('ss'):
+        return term[:-1]
+    return term
+
+
+def word_forms(word: str) -> set:
+    """Singular and plural spellings of one lowercased word ('olive' -> olive, olives, ...)."""
+    singular = preference_term(word)
+    forms = {word, singular, singular + 's', singular + 'es'}
+    if singular.endswith('y'):
+        forms.add(singular[:-1] + 'ies')
+    return forms
+
+
+def preference_pattern(ingredient: str) -> Optional[re.Pattern]:
+    """
+    Whole-word regex for a liked/disliked ingredient, each word in singular or plural form:
+    'Peas' matches 'pea' and 'peas' but not 'peanut', 'Nuts' does not match 'nutmeg'. An
+    oil pressed from the food ('olive oil' for 'Olives') is a different ingredient and does
+    not match. None if the ingredient has no word characters.
+    """
+    words = WORD_RE.findall(ingredient.lower())
+    if not words:
+        return None
+    alternatives = [
+        "(?:" + "|".join(re.escape(f) for f in sorted(word_forms(w), key=len, reverse=True)) + ")"
+        for w in words
+    ]
+    pattern = r"(?<!\w)" + r"\W+".join(alternatives) + r"(?!\w)"
+    if preference_term(words[-1]) != PRESSED_OIL:
+        pattern += rf"(?!\W+{PRESSED_OIL}s?(?!\w))"
+    return re.compile(pattern)
+
+
+def _tokenize(text: str) -> set:
+    """Distinct maximal word tokens of `text` (same tokens as WORD_RE.findall)."""
+    if text.isascii():
+        return set(text.translate(_ASCII_NON_WORD).split())
+    return set(WORD_RE.findall(text))
+
+
+def _lower_str(values) -> pd.Series:
+    """
+    Equivalent to `Series.astype(str).str.lower()`, but the numpy repr of array-valued
+    cells (e.g. tags) is only computed once per distinct array.
+    """
+    seen = {}
+    out = []
+    for value in values:
+        key = tuple(value.tolist()) if isinstance(value, np.ndarray) and value.ndim == 1 else None
+        text = seen.get(key) if key is not None else None
+        if text is None:
+            text = str(value).lower()
+            if key is not None:
+                seen[key] = text
+        out.append(text)
+    return pd.Series(out, dtype=object)
+
+
+def scan_hard_constraints(df: pd.DataFrame, profile: Dict) -> pd.DataFrame:
+    """
+    Reference implementation: full-table string scan per request.
+    Kept for verification/benchmarks; the engine uses ConstraintIndex instead.
+    """
+    filtered_df = df.copy()
+    diet_profile = profile['dietaryProfile']
+
+    # 1. Allergy Filter
+    allergies = [a.lower() for a in diet_profile['foodAllergies']['selected']]
+    if allergies:
+        # Function to check if ANY allergy word appears in the ingredients string
+        def contains_allergen(ing_str):
+            ing_lower = str(ing_str).lower()
+            for allergen in allergies:
+                if allergen in ing_lower:
+                    return True
+            return False
+
+        # Keep rows that do NOT contain allergens
+        filtered_df = filtered_df[~filtered_df['ingredients'].apply(contains_allergen)]
+
+    # 2. Dietary Restrictions (e.g., Vegan, Vegetarian)
+    restrictions = [r.lower() for r in diet_profile['dietaryRestrictions']['selected']]
+    for restriction in restrictions:
+        if 'vegan' in restriction:
+            filtered_df = filtered_df[filtered_df['tags'].astype(str).str.lower().str.contains('vegan')]
+        elif 'vegetarian' in restriction:
+            filtered_df = filtered_df[filtered_df['tags'].astype(str).str.lower().str.contains('vegetarian')]
+        elif 'gluten' in restriction:
+            filtered_df = filtered_df[
+                filtered_df['tags'].astype(str).str.lower().str.contains('gluten') |
+                ~filtered_df['ingredients'].astype(str).str.lower().str.contains(GLUTEN_INGREDIENTS)
+            ]
+
+    return filtered_df
+
+
+class ConstraintIndex:
+    """
+    Hard-constraint index built once at load time. A persona's safe set is computed by
+    AND-ing precomputed boolean masks instead of scanning every ingredient string.
+
+    - Restriction rules (vegan / vegetarian / gluten) are one mask each.
+    - Allergens use an inverted index of lowercased word tokens -> row positions.
+      A word-only allergen occurs in an ingredient string iff it occurs inside one of
+      the string's maximal word tokens, so OR-ing the postings of every vocabulary token
+      containing the allergen reproduces the substring check exactly. Other allergens
+      (spaces, punctuation) fall back to one vectorized substring scan.
+      Either way the resulting mask is memoized per term.
+    """
+
+    def __init__(self, recipes_df: pd.DataFrame):
+        self._haystacks = np.array([str(s).lower() for s in recipes_df['ingredients']], dtype=object)
+
+        self._postings = self._build_postings(self._haystacks)
+        # Rows changed since the postings were built; these are checked directly
+        self._overrides = set()
+        self._term_masks: Dict[str, np.ndarray] = {}
+        self._preference_masks: Dict[str, np.ndarray] = {}
+        self._rule_masks = self._build_rule_masks(recipes_df)
+
+    def __len__(self):
+        return len(self._haystacks)
+
+    @staticmethod
+    def _build_postings(haystacks: np.ndarray) -> Dict[str, np.ndarray]:
+        """Inverted index: token -> sorted row positions containing it."""
+        row_tokens = [_tokenize(h) for h in haystacks]
+        lengths = np.fromiter(map(len, row_tokens), dtype=np.int64, count=len(row_tokens))
+        flat = np.fromiter(itertools.chain.from_iterable(row_tokens), dtype=object, count=int(lengths.sum()))
+        rows = np.repeat(np.arange(len(row_tokens)), lengths)
+
+        codes, vocab = pd.factorize(flat)
+        order = np.argsort(codes, kind="stable")
+        bounds = np.searchsorted(codes[order], np.arange(len(vocab) + 1))
+        return {tok: rows[order[bounds[i]:bounds[i + 1]]] for i, tok in enumerate(vocab)}
+
+    @staticmethod
+    def _build_rule_masks(df: pd.DataFrame) -> Dict[str, np.ndarray]:
+        tags = _lower_str(df['tags'])
+        ingredients = _lower_str(df['ingredients'])
+        return {
+            # Copies: pandas may hand back read-only views, and `update` patches these in place
+            'vegan': tags.str.contains('vegan', na=False).to_numpy(dtype=bool, copy=True),
+            'vegetarian': tags.str.contains('vegetarian', na=False).to_numpy(dtype=bool, copy=True),
+            'gluten': (
+                tags.str.contains('gluten', na=False).to_numpy(dtype=bool) |
+                ~ingredients.str.contains(GLUTEN_INGREDIENTS, na=False).to_numpy(dtype=bool)
+            ),
+        }
+
+    def term_mask(self, term: str) -> np.ndarray:
+        """Boolean mask of rows whose lowercased ingredients contain `term` (memoized)."""
+        term = term.lower()
+        mask = self._term_masks.get(term)
+        if mask is not None:
+            return mask
+
+        if WORD_RE.fullmatch(term):
+            mask = np.zeros(len(self), dtype=bool)
+            for tok, positions in self._postings.items():
+                if term in tok:
+                    mask[positions] = True
+            for pos in self._overrides:
+                mask[pos] = term in self._haystacks[pos]
+        else:
+            mask = pd.Series(self._haystacks).str.contains(term, regex=False).to_numpy(dtype=bool, copy=True)
+
+        mask.flags.writeable = False
+        self._term_masks[term] = mask
+        return mask
+
+    def preference_mask(self, ingredient: str) -> np.ndarray:
+        """
+        Boolean mask of rows containing a liked/disliked `ingredient` as whole words, in
+        singular or plural form (see `preference_pattern`); memoized. Allergens use the
+        stricter substring check of `term_mask` instead.
+        """
+        pattern = preference_pattern(ingredient)
+        if pattern is None:
+            return np.zeros(len(self), dtype=bool)
+        mask = self._preference_masks.get(pattern.pattern)
+        if mask is not None:
+            return mask
+
+        # Rows holding every word (in some form) as a token, then checked with the pattern
+        # (word order, pressed oils)
+        candidates = None
+        for word in WORD_RE.findall(ingredient.lower()):
+            word_rows = np.zeros(len(self), dtype=bool)
+            for form in word_forms(word):
+                positions = self._postings.get(form)
+                if positions is not None:
+                    word_rows[positions] = True
+            candidates = word_rows if candidates is None else candidates & word_rows
+        mask = candidates
+        rows = np.flatnonzero(mask)
+        mask[rows] = [pattern.search(h) is not None for h in self._haystacks[rows]]
+        for pos in self._overrides:
+            mask[pos] = pattern.search(self._haystacks[pos]) is not None
+
+        mask.flags.writeable = False
+        self._preference_masks[pattern.pattern] = mask
+        return mask
+
+    def safe_mask(self, allergies: List[str], restrictions: List[str]) -> np.ndarray:
+        """Rows that contain none of the allergens and satisfy every restriction rule."""
+        mask = np.ones(len(self), dtype=bool)
+        for allergen in allergies:
+            mask &= ~self.term_mask(allergen)
+        for restriction in restrictions:
+            rule = restriction_rule(restriction)
+            if rule is not None:
+                mask &= self._rule_masks[rule]
+        return mask
+
+    def update(self, positions: np.ndarray, rows: pd.DataFrame):
+        """
+        Refreshes the given (changed or appended) rows. Postings are left untouched; changed
+        rows are tracked as overrides and patched into every cached mask, so the cost scales
+        with the size of the delta. `rows` is fully read before anything is modified, so a
+        bad batch raises without touching the index.
+        """
+        positions = np.asarray(positions, dtype=np.int64)
+        if len(positions) == 0:
+            return
+        haystacks = [str(s).lower() for s in rows['ingredients']]
+        rule_masks = self._build_rule_masks(rows)
+
+        grown = int(positions.max()) + 1 - len(self)
+        if grown > 0:
+            self._haystacks = np.concatenate([self._haystacks, np.full(grown, '', dtype=object)])
+            for name, mask in self._rule_masks.items():
+                self._rule_masks[name] = np.concatenate([mask, np.zeros(grown, dtype=bool)])
+            for term, mask in self._term_masks.items():
+                self._term_masks[term] = np.concatenate([mask, np.zeros(grown, dtype=bool)])
+            for key, mask in self._preference_masks.items():
+                self._preference_masks[key] = np.concatenate([mask, np.zeros(grown, dtype=bool)])
+
+        self._haystacks[positions] = haystacks
+        self._overrides.update(positions.tolist())
+
+        for name, mask in rule_masks.items():
+            self._rule_masks[name][positions] = mask
+        for term, mask in self._term_masks.items():
+            mask.flags.writeable = True
+            mask[positions] = [term in h for h in self._haystacks[positions]]
+            mask.flags.writeable = False
+        for key, mask in self._preference_masks.items():
+            pattern = re.compile(key)
+            mask.flags.writeable = True
+            mask[positions] = [pattern.search(h) is not None for h in self._haystacks[positions]]
+            mask.flags.writeable = False
+
+    def compact(self, keep: np.ndarray):
+        """
+        Drops every row not in `keep` (sorted positions); row `keep[i]` becomes row `i`.
+        Postings and cached masks are remapped, nothing is re-tokenized.
+        """
+        new_pos = np.full(len(self), -1, dtype=np.int64)
+        new_pos[keep] = np.arange(len(keep))
+
+        postings = {}
+        for tok, positions in self._postings.items():
+            positions = new_pos[positions]
+            positions = positions[positions >= 0]
+            if len(positions):
+                postings[tok] = positions
+        self._postings = postings
+        self._overrides = {int(new_pos[p]) for p in self._overrides if new_pos[p] >= 0}
+
+        self._haystacks = self._haystacks[keep]
+        self._rule_masks = {name: mask[keep] for name, mask in self._rule_masks.items()}
+        for masks in (self._term_masks, self._preference_masks):
+            for key, mask in masks.items():
+                mask = mask[keep]
+                mask.flags.writeable = False
+                masks[key] = mask
@@ -0,0 +1,147 @@
+import os
+import hashlib
+import numpy as np
+from pathlib import Path
+from typing import Callable, List
+
+from lru_cache import LRUCache
+from vector_index import l2_normalize
+
+
+def _record_dtype(dim: int) -> np.dtype:
+    """One cache row: the content key next to its vector, so both are replaced together."""
+    return np.dtype([("key", "S40"), ("vector", np.float32, (dim,))])
+
+
+class EmbeddingStore:
+    """
+    Content-addressed, on-disk cache for recipe embeddings.
+
+    Each vector is keyed by sha1(model name + semantic_doc), so a recipe is only
+    re-encoded when its document text (or the embedding model) changes.
+    Keys and vectors share one .npy file of (key, vector) records, memory-mapped on
+    load; the `vector` field is a strided view usable like a plain float32 matrix.
+
+    With `normalize=True` vectors are stored L2-normalized (and keyed separately from raw
+    vectors), so cosine similarity becomes a plain dot product on the memory-mapped rows.
+    """
+
+    def __init__(self, path: Path, model_name: str, normalize: bool = False):
+        self.path = Path(path)
+        # Keys used to live in a sibling file; removed on the next save
+        self.legacy_keys_path = self.path.with_name(self.path.stem + ".keys.npy")
+        self.model_name = model_name
+        self.normalize = normalize
+        # Digest of every content key of the last `get_or_compute` result, in row order:
+        # identifies those embeddings exactly without reading them (see vector_index.build_index)
+        self.fingerprint = None
+
+    def doc_key(self, doc: str) -> bytes:
+        namespace = f"{self.model_name}:l2" if self.normalize else self.model_name
+        digest = hashlib.sha1(f"{namespace}\x00{doc}".encode("utf-8"))
+        return digest.hexdigest().encode("ascii")
+
+    def _load(self):
+        """Returns (keys, vectors) from disk, or (None, None) if missing/corrupt."""
+        if not self.path.exists():
+            return None, None
+        try:
+            records = np.load(self.path, mmap_mode="c")
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Warning: Ignoring unreadable embedding cache ({e}).")
+            return None, None
+        if records.dtype.names != ("key", "vector") or records.ndim != 1:
+            print("⚠️ Warning: Embedding cache is in an old or unknown format. Rebuilding.")
+            return None, None
+        return np.array(records["key"]), records["vector"]
+
+    def get_or_compute(self, docs: List[str], encode_fn: Callable[[List[str]], np.ndarray]) -> np.ndarray:
+        """
+        Returns one embedding row per doc, encoding only docs missing from the cache.
+        The result is always the memory-mapped cache file, opened copy-on-write: rows are
+        paged in on demand, and in-place writes (catalog updates) stay private to this process.
+        """
+        keys = np.array([self.doc_key(d) for d in docs], dtype="S40")
+        self.fingerprint = hashlib.sha1(keys.tobytes()).hexdigest()
+        stored_keys, stored_vectors = self._load()
+
+        if stored_keys is not None and np.array_equal(keys, stored_keys):
+            print(f"Loaded {len(keys)} cached embeddings from {self.path}.")
+            return stored_vectors
+
+        positions = np.full(len(keys), -1, dtype=np.int64)
+        if stored_keys is not None:
+            lookup = {k: i for i, k in enumerate(stored_keys.tolist())}
+            positions = np.array([lookup.get(k, -1) for k in keys.tolist()], dtype=np.int64)
+
+        missing = np.flatnonzero(positions < 0)
+        print(f"Embedding cache: {len(keys) - len(missing)} hits, {len(missing)} to encode.")
+
+        new_vectors = None
+        if len(missing):
+            new_vectors = np.asarray(encode_fn([docs[i] for i in missing]), dtype=np.float32)
+            if self.normalize:
+                new_vectors = l2_normalize(new_vectors)
+
+        if new_vectors is not None:
+            dim = new_vectors.shape[1]
+        else:
+            dim = stored_vectors.shape[1] if stored_vectors is not None else 0
+        # Written straight to a temp file, then swapped in with os.replace (readers never see
+        # partial data) and mapped back, so no full float32 copy is held in RAM
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        records = np.lib.format.open_memmap(tmp, mode="w+", dtype=_record_dtype(dim), shape=(len(keys),))
+        records["key"] = keys
+        hit = positions >= 0
+        if hit.any():
+            records["vector"][hit] = stored_vectors[positions[hit]]
+        if new_vectors is not None:
+            records["vector"][missing] = new_vectors
+        records.flush()
+        del records, stored_vectors, new_vectors
+
+        os.replace(tmp, self.path)
+        self.legacy_keys_path.unlink(missing_ok=True)
+        return self._load()[1]
+
+
+class QueryEmbeddingCache(LRUCache):
+    """
+    Bounded LRU cache of user query text -> embedding, optionally persisted between runs.
+    The file records the model name and is ignored if it was written by a different model.
+    """
+
+    def __init__(self, maxsize: int, model_name: str):
+        super().__init__(maxsize)
+        self.model_name = model_name
+
+    def load(self, path: Path):
+        path = Path(path)
+        if not path.exists():
+            return
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                if str(data["model_name"]) != self.model_name:
+                    return
+                for text, vector in zip(data["texts"].tolist(), data["vectors"]):
+                    self.put(text, vector)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"⚠️ Warning: Ignoring unreadable query cache ({e}).")
+            return
+        print(f"Loaded {len(self)} cached query embeddings from {path}.")
+
+    def save(self, path: Path):
+        entries = self.items()
+        if not entries:
+            return
+        path = Path(path)
+        tmp = path.with_name(path.name + ".tmp")
+        with open(tmp, "wb") as f:
+            np.savez(
+                f,
+                model_name=self.model_name,
+                texts=np.array([text for text, _ in entries], dtype=str),
+                vectors=np.stack([vector for _, vector in entries]),
+            )
+        os.replace(tmp, path)
@@ -1,30 +1,98 @@
 import json
 import os
-import time
+import hashlib
+import argparse
+import threading
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
-from google import genai
-from google.genai import types
+
+from jsonl_log import JsonlWriter, read_jsonl
+from rate_limit import AdaptiveRateLimiter, call_with_retries, estimate_tokens
+from response_cache import ResponseCache
 
 # --- Configuration ---
 INPUT_FILE = Path("data/output/recommendations_ab.json")
-OUTPUT_FILE = Path("data/output/evaluation_results_gemini_scientific.json")
 MODEL_NAME = "gemini-2.5-flash"
 
-# Load API Key
-load_dotenv()
-API_KEY = os.getenv("GEMINI_API_KEY")
+# --- Judges ---
+# Each judge writes `output_file` (the LLM score files json_to_csv.py reads) and, next to it, a
+# results log with the same name and a .jsonl suffix. Selected judges run in one pass.
+JUDGES = {
+    "scientific": {
+        "evaluator_name": "Gemini-2.5-Flash (Scientific Reviewer)",
+        "model": MODEL_NAME,
+        "role": "You are an impartial Scientific Reviewer specializing in Recommender Systems and Explainable AI.",
+        "output_file": Path("data/output/evaluation_results_gemini_scientific.json"),
+    },
+    "nutritionist": {
+        "evaluator_name": "Gemini-2.5-Flash (Nutritionist Evaluator)",
+        "model": MODEL_NAME,
+        "role": "You are an impartial Nutritionist evaluator reviewing food recommendations for general healthy eating guidance.",
+        "output_file": Path("data/output/evaluation_results_gemini_nutritionist.json"),
+    },
+}
+EVAL_JUDGES = list(JUDGES)          # Judges run by default (--judges)
+
+# --- Judge calls (match these to your Gemini quota) ---
+EVAL_MAX_CONCURRENCY = 8            # Parallel judge requests per judge
+EVAL_REQUESTS_PER_MINUTE = 600      # Per model, shared by its judges; halved on quota errors, recovered gradually
+EVAL_MAX_RETRIES = 6                # On 429 / RESOURCE_EXHAUSTED / 5xx / connection errors
+EVAL_BACKOFF_BASE_SECONDS = 2.0     # Exponential backoff: base * 2^attempt (jittered)
+EVAL_BACKOFF_MAX_SECONDS = 60.0
+EVAL_BATCH_PER_PERSONA = False      # Score all of a persona's recommendations in one request (--batched)
+
+# --- Judge response cache ---
+JUDGE_CACHE_FILE = Path("data/output/judge_cache.sqlite")
+JUDGE_CACHE_ENABLED = True          # Reuse parsed scores for an identical (model, prompt); --no-cache bypasses
+JUDGE_CACHE_TTL_SECONDS = 90 * 24 * 3600
+JUDGE_CACHE_MAX_ENTRIES = 200_000
+
+SCORE_FIELDS = [("rel", "relevance_score"), ("trans", "transparency_score"), ("pers", "persuasiveness_score")]
+
+_client = None
+_print_lock = threading.Lock()  # Progress lines come from the main thread and the judge workers
+
+def get_client():
+    """The Gemini client, created on first use (importing this module stays cheap)."""
+    global _client
+    if _client is None:
+        from google import genai
+
+        # Load API Key
+        load_dotenv()
+        api_key = os.getenv("GEMINI_API_KEY")
+
+        if not api_key:
+            raise ValueError("GEMINI_API_KEY not found in .env file")
+
+        _client = genai.Client(api_key=api_key)
+    return _client
+
+SYSTEM_ROLE = JUDGES["scientific"]["role"]
+
+METRIC_DEFINITIONS = """1. RELEVANCE (1-5):
+   Is the meal appropriate and relevant for the user's specific goals and constraints? 
 
-if not API_KEY:
-    raise ValueError("GEMINI_API_KEY not found in .env file")
+2. TRANSPARENCY (1-5):
+   It aims to evaluate whether the explanations can reveal the internal working principles of the recommender models.
 
-client = genai.Client(api_key=API_KEY)
+3. PERSUASIVENESS (1-5):
+   It aims to evaluate “whether the explanations can increase the interaction probability of the users on the items."""
 
-def generate_prompt(persona, recipe):
-    """
-    Constructs the prompt.
-    """
-    
+
+def _profile_block(persona):
+    return f"""--- USER PROFILE ---
+Description: {persona['description']}
+Goal: {persona['profile']['dietary_goal']}
+Dietary Constraints: {json.dumps(persona['profile']['dietaryProfile'])}
+Liked Ingredients: {", ".join(persona['profile']['likedIngredients'])}
+Disliked Ingredients: {", ".join(persona['profile'].get('dislikedIngredients', []))}
+Favorite Cuisines: {", ".join(persona['profile'].get('favoriteCuisines', []))}
+--------------------"""
+
+
+def _recommendation_block(recipe, header="--- RECOMMENDATION ---"):
     # 1. Format Nutrition
     nutri = recipe.get('nutrition', {})
     nutri_str = (
@@ -42,49 +110,35 @@ def generate_prompt(persona, recipe):
     explanation_text = recipe.get('explanation', "").strip()
     explanation_display = f'"{explanation_text}"' if explanation_text else "[NO EXPLANATION PROVIDED]"
 
-    # 4. Construct the Full Prompt
-    # We have two Roles:
-    #    1. Scientific Reviewer:
-    #       You are an impartial Scientific Reviewer specializing in Recommender Systems and Explainable AI.
-    #    2. Nutritionist Evaluator:
-    #       You are an impartial Nutritionist evaluator reviewing food recommendations for general healthy eating guidance.
+    return f"""{header}
+Item: {recipe['title']}
+Nutrition: {nutri_str}
+Ingredients: {ing_str}
+
+Explanation Provided: {explanation_display}
+{"-" * len(header)}"""
+
 
+def generate_prompt(persona, recipe, role=SYSTEM_ROLE):
+    """
+    Constructs the prompt.
+    """
     full_prompt = f"""
 SYSTEM ROLE:
-You are an impartial Scientific Reviewer specializing in Recommender Systems and Explainable AI.
+{role}
 Your job is to audit the quality of a food recommendation and its explanation using defined metrics.
 Do not assume any information beyond what is provided.
 
 TASK:
 Please evaluate the following food recommendation against the User Profile.
 
---- USER PROFILE ---
-Description: {persona['description']}
-Goal: {persona['profile']['dietary_goal']}
-Dietary Constraints: {json.dumps(persona['profile']['dietaryProfile'])}
-Liked Ingredients: {", ".join(persona['profile']['likedIngredients'])}
-Disliked Ingredients: {", ".join(persona['profile'].get('dislikedIngredients', []))}
-Favorite Cuisines: {", ".join(persona['profile'].get('favoriteCuisines', []))}
---------------------
+{_profile_block(persona)}
 
---- RECOMMENDATION ---
-Item: {recipe['title']}
-Nutrition: {nutri_str}
-Ingredients: {ing_str}
-
-Explanation Provided: {explanation_display}
-----------------------
+{_recommendation_block(recipe)}
 
 Score the following 3 metrics on a scale of 1 (Poor) to 5 (Excellent).
 
-1. RELEVANCE (1-5):
-   Is the meal appropriate and relevant for the user's specific goals and constraints? 
-
-2. TRANSPARENCY (1-5):
-   It aims to evaluate whether the explanations can reveal the internal working principles of the recommender models.
-
-3. PERSUASIVENESS (1-5):
-   It aims to evaluate “whether the explanations can increase the interaction probability of the users on the items.
+{METRIC_DEFINITIONS}
 
 Note: Some recommendations may not have an explanation.
 
@@ -98,7 +152,318 @@ Output strictly valid JSON with these keys:
 """
     return full_prompt
 
-def run_evaluation():
+
+def generate_batch_prompt(persona, recipes, role=SYSTEM_ROLE):
+    """
+    One prompt scoring all of a persona's `recipes`: the profile is sent once and the
+    answer is an `evaluations` array with one entry per recommendation, in order.
+    """
+    blocks = "\n\n".join(
+        _recommendation_block(recipe, header=f"--- RECOMMENDATION {i + 1} ---") for i, recipe in enumerate(recipes)
+    )
+    return f"""
+SYSTEM ROLE:
+{role}
+Your job is to audit the quality of food recommendations and their explanations using defined metrics.
+Do not assume any information beyond what is provided.
+
+TASK:
+Please evaluate each of the following {len(recipes)} food recommendations against the User Profile.
+Judge every recommendation on its own; do not rank them against each other.
+
+{_profile_block(persona)}
+
+{blocks}
+
+Score each recommendation on the following 3 metrics on a scale of 1 (Poor) to 5 (Excellent).
+
+{METRIC_DEFINITIONS}
+
+Note: Some recommendations may not have an explanation.
+
+Output strictly valid JSON with exactly {len(recipes)} evaluations, in the order of the recommendations:
+{{
+  "evaluations": [
+    {{
+      "recommendation": int (1-{len(recipes)}),
+      "relevance_score": int,
+      "transparency_score": int,
+      "persuasiveness_score": int,
+      "reasoning": "Short justification (1-2 sentences)"
+    }}
+  ]
+}}
+"""
+
+
+def parse_batch_scores(result, n: int) -> list:
+    """
+    Validates a batched judge answer and returns the `n` evaluations in recommendation
+    order. Raises ValueError on anything malformed (wrong count, duplicate or unknown
+    recommendation numbers, scores outside 1-5).
+    """
+    evaluations = result.get("evaluations") if isinstance(result, dict) else None
+    if not isinstance(evaluations, list) or len(evaluations) != n:
+        raise ValueError(f"expected {n} evaluations")
+    ordered = [None] * n
+    for position, evaluation in enumerate(evaluations):
+        if not isinstance(evaluation, dict):
+            raise ValueError("evaluation is not an object")
+        number = evaluation.get("recommendation", position + 1)
+        if not isinstance(number, int) or not 1 <= number <= n or ordered[number - 1] is not None:
+            raise ValueError(f"bad recommendation number {number!r}")
+        for _, field in SCORE_FIELDS:
+            score = evaluation.get(field)
+            if isinstance(score, bool) or not isinstance(score, int) or not 1 <= score <= 5:
+                raise ValueError(f"bad {field} {score!r}")
+        ordered[number - 1] = evaluation
+    return ordered
+
+
+def _is_quota_error(error: Exception) -> bool:
+    return getattr(error, "code", None) == 429 or "RESOURCE_EXHAUSTED" in str(error)
+
+
+def _is_retryable_judge_error(error: Exception) -> bool:
+    """Quota errors (429 / RESOURCE_EXHAUSTED), server errors (5xx) and connection problems."""
+    code = getattr(error, "code", None)
+    if isinstance(code, int):
+        return code == 429 or code >= 500
+    if _is_quota_error(error):
+        return True
+    # google-genai talks to the API through httpx; its transport errors are transient
+    return isinstance(error, (ConnectionError, TimeoutError)) or type(error).__module__.startswith("httpx")
+
+
+class JudgeUsage:
+    """Thread-safe call and token counters for a run (API-reported tokens, estimated when absent)."""
+
+    def __init__(self):
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.output_tokens = 0
+        self.fallbacks = 0
+        self.cached = 0
+        self._lock = threading.Lock()
+
+    def record(self, prompt: str, response):
+        usage = getattr(response, "usage_metadata", None)
+        with self._lock:
+            self.calls += 1
+            self.prompt_tokens += getattr(usage, "prompt_token_count", None) or estimate_tokens(prompt)
+            self.output_tokens += getattr(usage, "candidates_token_count", None) or estimate_tokens(response.text)
+
+    def record_cache_hit(self):
+        with self._lock:
+            self.cached += 1
+
+    def record_fallback(self):
+        with self._lock:
+            self.fallbacks += 1
+
+
+def evaluate_item(client, rate_limiter: AdaptiveRateLimiter, prompt: str, model: str = MODEL_NAME,
+                  usage: JudgeUsage = None, cache: ResponseCache = None, validate=None):
+    """
+    One judge call (rate limited, retried with backoff); returns the parsed JSON scores,
+    passed through `validate` when given. Answers are looked up in and stored to `cache`
+    under (model, prompt hash); only answers that parse and validate are stored.
+    """
+    cache_key = None
+    if cache is not None and cache.enabled:
+        cache_key = cache.make_key(model, prompt_hash(prompt))
+        cached = cache.get(cache_key)
+        if cached is not None:
+            if usage is not None:
+                usage.record_cache_hit()
+            return json.loads(cached)
+
+    def request():
+        rate_limiter.acquire()
+        return client.models.generate_content(
+            model=model,
+            contents=prompt,
+            config={"response_mime_type": "application/json"}
+        )
+
+    def on_retry(error):
+        if _is_quota_error(error):
+            rate_limiter.on_quota_error()
+
+    response = call_with_retries(
+        request, _is_retryable_judge_error,
+        max_retries=EVAL_MAX_RETRIES, base_delay=EVAL_BACKOFF_BASE_SECONDS, max_delay=EVAL_BACKOFF_MAX_SECONDS,
+        on_retry=on_retry
+    )
+    rate_limiter.on_success()
+    if usage is not None:
+        usage.record(prompt, response)
+    result = json.loads(response.text)
+    if validate is not None:
+        result = validate(result)
+    if cache_key is not None:
+        cache.put(cache_key, json.dumps(result))
+    return result
+
+
+def judge_group(client, run: dict, group: list) -> list:
+    """
+    Judges a group of one judge's items for one persona; returns (item, scores or exception)
+    per item. Groups of several items are sent as one batched prompt; if the answer is
+    malformed, the group falls back to per-item calls.
+    """
+    judge, rate_limiter, usage, cache = run["judge"], run["rate_limiter"], run["usage"], run["cache"]
+    if len(group) > 1:
+        prompt = generate_batch_prompt(group[0]["persona"], [item["recipe"] for item in group], judge["role"])
+        try:
+            evaluations = evaluate_item(client, rate_limiter, prompt, judge["model"], usage, cache,
+                                        validate=lambda result: parse_batch_scores(result, len(group)))
+            return list(zip(group, evaluations))
+        except (json.JSONDecodeError, ValueError) as e:
+            usage.record_fallback()
+            with _print_lock:
+                print(f"   ⚠️ Warning: Malformed batched answer from {run['name']} for "
+                      f"{group[0]['key'].split('_')[0]} ({e}); falling back to {len(group)} per-item calls.")
+        except Exception as e:
+            return [(item, e) for item in group]
+
+    outcomes = []
+    for item in group:
+        try:
+            outcomes.append((item, evaluate_item(client, rate_limiter, item["prompt"], judge["model"], usage, cache)))
+        except Exception as e:
+            outcomes.append((item, e))
+    return outcomes
+
+
+def prompt_hash(prompt: str) -> str:
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+
+def results_log_file(judge: dict) -> Path:
+    """One record per judged item, appended as it completes."""
+    return judge["output_file"].with_suffix(".jsonl")
+
+
+def load_results_log(path: Path) -> dict:
+    """Latest log record per key (a later retry supersedes an earlier failure)."""
+    return {record["key"]: record for record in read_jsonl(path)}
+
+
+def select_items(items: list, log: dict, mode: str) -> list:
+    """
+    Items still to judge. "all" judges everything; "resume" skips keys already scored for
+    the same prompt; "retry-failed" only re-judges keys whose latest record failed.
+    """
+    if mode == "all":
+        return items
+    todo = []
+    for item in items:
+        record = log.get(item["key"])
+        same_prompt = record is not None and record.get("prompt_hash") == prompt_hash(item["prompt"])
+        if mode == "resume" and not (same_prompt and record["status"] == "ok"):
+            todo.append(item)
+        elif mode == "retry-failed" and same_prompt and record["status"] == "failed":
+            todo.append(item)
+    return todo
+
+
+def _interleave(queues: list) -> list:
+    """Round-robin merge, so every judge makes progress from the start of the run."""
+    merged = []
+    for i in range(max((len(q) for q in queues), default=0)):
+        merged.extend(q[i] for q in queues if i < len(q))
+    return merged
+
+
+def judge_items(client, runs: list, concurrency: int, batched: bool = False):
+    """
+    Judges every run's `todo` items on one shared worker pool (one task per item, or per
+    persona when `batched`; judges interleaved), appending one ok/failed record per item
+    to the run's writer as it completes.
+    """
+    queues = []
+    for run in runs:
+        if batched:
+            groups = {}
+            for item in run["todo"]:
+                groups.setdefault(item["persona_idx"], []).append(item)
+            queues.append([(run, group) for group in groups.values()])
+        else:
+            queues.append([(run, [item]) for item in run["todo"]])
+
+    total = sum(len(run["todo"]) for run in runs)
+    done = 0
+    pool = ThreadPoolExecutor(max_workers=max(1, concurrency))
+    try:
+        futures = {pool.submit(judge_group, client, run, group): run for run, group in _interleave(queues)}
+        for future in as_completed(futures):
+            run = futures[future]
+            for item, result in future.result():
+                record = {"key": item["key"], "prompt_hash": prompt_hash(item["prompt"])}
+                if isinstance(result, Exception):
+                    record.update(status="failed", error=f"{type(result).__name__}: {result}")
+                    status = f"Error: {result}"
+                else:
+                    record.update(status="ok", scores={suffix: str(result.get(field, 0)) for suffix, field in SCORE_FIELDS},
+                                  reasoning=result.get("reasoning", ""))
+                    status = "Done."
+                run["writer"].write(record)
+                done += 1
+                with _print_lock:
+                    print(f"   [{done}/{total}] {run['name']} {item['key']}: {status}")
+    except KeyboardInterrupt:
+        print(f"\n⚠️ Warning: Interrupted; {done} results are in the results logs. Re-run with --resume to continue.")
+        raise
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def build_flat_results(judge: dict, items: list, log: dict) -> tuple:
+    """
+    The output file layout (pX_rY_rel/_trans/_pers in input order). Items without a
+    successful result for their current prompt are filled with "0" and returned as missing.
+    """
+    flat_results = {
+        "evaluator_name": judge["evaluator_name"]
+    }
+    missing = []
+    for item in items:
+        record = log.get(item["key"])
+        ok = record is not None and record["status"] == "ok" and record.get("prompt_hash") == prompt_hash(item["prompt"])
+        if not ok:
+            missing.append(item["key"])
+        for suffix, _ in SCORE_FIELDS:
+            flat_results[f"{item['key']}_{suffix}"] = record["scores"][suffix] if ok else "0"
+    return flat_results, missing
+
+
+def report_usage(name: str, usage: JudgeUsage, todo: list, batched: bool):
+    cached = f" ({usage.cached} answers from cache)" if usage.cached else ""
+    print(f"{name}: {usage.calls} calls{cached}, {usage.prompt_tokens} prompt + {usage.output_tokens} output tokens.")
+    if batched and usage.calls:
+        per_item_tokens = sum(estimate_tokens(item["prompt"]) for item in todo)
+        print(f"   Batched judging: {usage.calls} calls for {len(todo)} items ({usage.calls / len(todo) - 1:+.0%}); "
+              f"{usage.prompt_tokens} prompt tokens vs ~{per_item_tokens} per item "
+              f"({usage.prompt_tokens / per_item_tokens - 1:+.0%}).")
+        if usage.fallbacks:
+            print(f"   ⚠️ Warning: {usage.fallbacks} batched answers were malformed and re-judged per item.")
+
+
+def run_evaluation(client=None, concurrency: int = EVAL_MAX_CONCURRENCY, mode: str = "all",
+                   batched: bool = EVAL_BATCH_PER_PERSONA, judges: list = EVAL_JUDGES,
+                   use_cache: bool = JUDGE_CACHE_ENABLED):
+    """
+    Runs the selected `judges` (names in JUDGES) over every recommendation in one pass and
+    writes each judge's output file. Judges share one pool of `concurrency` workers per
+    judge, and judges on the same model share that model's rate limit.
+
+    Each result (or failure) is first appended to the judge's results log, so an
+    interrupted run can continue with mode="resume" and failed calls can be redone with
+    mode="retry-failed" without repeating paid calls. With `batched`, each persona's
+    recommendations are scored in a single request. With `use_cache`, a prompt already
+    judged by the same model (JUDGE_CACHE_FILE) is answered without an API call.
+    """
     if not INPUT_FILE.exists():
         print(f"Error: {INPUT_FILE} not found.")
         return
@@ -106,63 +471,119 @@ def run_evaluation():
     with open(INPUT_FILE, 'r', encoding='utf-8') as f:
         data = json.load(f)
 
-    flat_results = {
-        "evaluator_name": "Gemini-2.5-Flash (Scientific Reviewer)"
-    }
+    cache = ResponseCache(JUDGE_CACHE_FILE, JUDGE_CACHE_TTL_SECONDS, JUDGE_CACHE_MAX_ENTRIES, enabled=use_cache)
+    rate_limiters = {}
+    runs = []
+    for name in judges:
+        judge = JUDGES[name]
+        # Items in output order; keys use 1-based indexing. The per-item prompt identifies
+        # the item in the results log whichever way it was judged.
+        items = [
+            {
+                "key": f"p{p_idx + 1}_r{r_idx + 1}",
+                "persona_idx": p_idx,
+                "persona": entry['persona'],
+                "recipe": recipe,
+                "prompt": generate_prompt(entry['persona'], recipe, judge["role"]),
+            }
+            for p_idx, entry in enumerate(data)
+            for r_idx, recipe in enumerate(entry['recommendations'])
+        ]
+        log_file = results_log_file(judge)
+        log = load_results_log(log_file) if mode != "all" else {}
+        todo = select_items(items, log, mode)
+        if mode != "all":
+            print(f"{name} {mode}: {len(todo)} of {len(items)} items to judge ({len(log)} keys in {log_file}).")
+        runs.append({
+            "name": name,
+            "judge": judge,
+            "items": items,
+            "todo": todo,
+            "log_file": log_file,
+            # Gemini quotas are per model, so judges on the same model share one limiter
+            "rate_limiter": rate_limiters.setdefault(judge["model"], AdaptiveRateLimiter(EVAL_REQUESTS_PER_MINUTE)),
+            "usage": JudgeUsage(),
+            "cache": cache,
+        })
+
+    active = [run for run in runs if run["todo"]]
+    if active:
+        client = client or get_client()
+        workers = concurrency * len(active)
+        print(f"Starting Evaluation with {', '.join(run['name'] for run in active)}: "
+              f"{sum(len(run['todo']) for run in active)} items, {workers} workers"
+              f"{', batched per persona' if batched else ''}...")
+        writers = [JsonlWriter(run["log_file"], append=mode != "all") for run in active]
+        try:
+            for run, writer in zip(active, writers):
+                run["writer"] = writer
+            judge_items(client, active, workers, batched=batched)
+        finally:
+            for writer in writers:
+                writer.close()
+
+        for model, rate_limiter in rate_limiters.items():
+            if rate_limiter.throttles:
+                print(f"⚠️ Warning: {model} hit the quota {rate_limiter.throttles} time(s); "
+                      f"ended at {rate_limiter.rate:.0f} requests/min (configured {EVAL_REQUESTS_PER_MINUTE}).")
+        for run in active:
+            report_usage(run["name"], run["usage"], run["todo"], batched)
+
+    cache.evict()
+    stats = cache.stats()
+    cache.close()
+    if stats["enabled"] and stats["hits"] + stats["misses"]:
+        print(f"Judge cache: {stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate']:.0%} hit rate), "
+              f"{stats['entries']} entries, {stats['evictions']} evicted.")
+
+    for run in runs:
+        output_file = run["judge"]["output_file"]
+        flat_results, missing = build_flat_results(run["judge"], run["items"], load_results_log(run["log_file"]))
+        with open(output_file, 'w', encoding='utf-8') as f:
+            json.dump(flat_results, f, indent=2)
+
+        if missing:
+            print(f"⚠️ Warning: {run['name']}: {len(missing)} items have no score and were saved as \"0\" "
+                  f"(e.g. {', '.join(missing[:5])}). Re-run with --retry-failed (or --resume) to judge them.")
+        print(f"✅ {run['name']}: Results saved to: {output_file}")
+
+    print("\n✅ Evaluation Complete.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Step 4: Automated scoring of the recommendations using Google Gemini.")
+    parser.add_argument("--judges", nargs="+", choices=list(JUDGES), default=EVAL_JUDGES,
+                        help="Judges to run in this pass")
+    parser.add_argument("--concurrency", type=int, default=EVAL_MAX_CONCURRENCY,
+                        help="Parallel judge requests per judge")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--resume", action="store_true",
+                      help="Skip items already scored in each judge's results log (.jsonl)")
+    mode.add_argument("--retry-failed", action="store_true",
+                      help="Only re-judge items whose last attempt in the results log failed")
+    parser.add_argument("--batched", action="store_true", default=EVAL_BATCH_PER_PERSONA,
+                        help="Score all of a persona's recommendations in one request")
+    parser.add_argument("--no-cache", action="store_true",
+                        help=f"Bypass the judge response cache ({JUDGE_CACHE_FILE.name}); always call the API")
+    parser.add_argument("--stub", action="store_true",
+                        help="Use the local stub judge (fake_judge.py) instead of the Gemini API")
+    parser.add_argument("--stub-latency", type=float, default=0.0,
+                        help="Seconds per stub request")
+    parser.add_argument("--stub-error-rate", type=float, default=0.0,
+                        help="Fraction of stub requests failing with 429 / 503")
+    parser.add_argument("--stub-malformed-rate", type=float, default=0.0,
+                        help="Fraction of batched stub answers with a missing evaluation")
+    args = parser.parse_args()
+
+    client = None
+    if args.stub:
+        from fake_judge import FakeJudgeClient
+        client = FakeJudgeClient(latency=args.stub_latency, error_rate=args.stub_error_rate,
+                                 malformed_rate=args.stub_malformed_rate)
+    mode = "resume" if args.resume else "retry-failed" if args.retry_failed else "all"
+    run_evaluation(client=client, concurrency=args.concurrency, mode=mode, batched=args.batched,
+                   judges=args.judges, use_cache=JUDGE_CACHE_ENABLED and not args.no_cache)
 
-    print(f"Starting Evaluation with {MODEL_NAME}...")
-    
-    for p_idx, entry in enumerate(data):
-        persona = entry['persona']
-        recommendations = entry['recommendations']
-        
-        print(f"\n--- Processing Persona {p_idx + 1} ---")
-
-        for r_idx, recipe in enumerate(recommendations):
-            print(f"   Evaluating Recipe {r_idx + 1}/{len(recommendations)}...", end="", flush=True)
-            
-            prompt = generate_prompt(persona, recipe)
-
-            #print('0000000000 _ DUMMY Print 1 _ Prompt below _ 0000000000')
-            #print(prompt)
-            #input("Press Enter to continue...")
-
-            try:
-                response = client.models.generate_content(
-                    model=MODEL_NAME,
-                    contents=prompt,
-                    config=types.GenerateContentConfig(
-                        response_mime_type="application/json" 
-                    )
-                )
-                
-                result = json.loads(response.text)
-
-                #print('0000000000 _ DUMMY Print 2 _ Response below _ 0000000000')
-                #print(response.text)
-                #input("Press Enter to continue...")
-
-                # 1-based indexing for keys
-                key_prefix = f"p{p_idx + 1}_r{r_idx + 1}"
-                
-                flat_results[f"{key_prefix}_rel"] = str(result.get('relevance_score', 0))
-                flat_results[f"{key_prefix}_trans"] = str(result.get('transparency_score', 0))
-                flat_results[f"{key_prefix}_pers"] = str(result.get('persuasiveness_score', 0))
-                
-                print(" Done.")
-                time.sleep(1) 
-
-            except Exception as e:
-                print(f" Error: {e}")
-                key_prefix = f"p{p_idx + 1}_r{r_idx + 1}"
-                flat_results[f"{key_prefix}_rel"] = "0"
-                flat_results[f"{key_prefix}_trans"] = "0"
-                flat_results[f"{key_prefix}_pers"] = "0"
-
-    with open(OUTPUT_FILE, 'w', encoding='utf-8') as f:
-        json.dump(flat_results, f, indent=2)
-
-    print(f"\n✅ Evaluation Complete. Results saved to: {OUTPUT_FILE}")
 
 if __name__ == "__main__":
-    run_evaluation()
\ No newline at end of file
+    main()
@@ -0,0 +1,79 @@
+"""
+Local stub of the Gemini client used by evaluator.py, for exercising the evaluation
+pipeline without API costs (`python src/evaluator.py --stub`).
+
+`FakeJudgeClient().models.generate_content(...)` returns deterministic 1-5 scores derived
+from the judge role and each recommendation in the prompt (the same for per-item and
+batched prompts), and can inject latency, 429/503 errors and malformed batched answers to
+test concurrency, rate limiting, retries and the per-item fallback.
+"""
+import re
+import json
+import time
+import random
+import hashlib
+import threading
+from types import SimpleNamespace
+
+from rate_limit import estimate_tokens
+
+RECOMMENDATION_RE = re.compile(r"^Item: .*?^Explanation Provided: .*?$", re.MULTILINE | re.DOTALL)
+ROLE_RE = re.compile(r"^SYSTEM ROLE:\n(.*)$", re.MULTILINE)
+
+
+class FakeJudgeError(Exception):
+    """Mimics google.genai.errors.APIError: the HTTP status is in `code`."""
+
+    def __init__(self, code: int, status: str):
+        super().__init__(f"{code} {status}")
+        self.code = code
+        self.status = status
+
+
+def _fake_scores(recommendation: str) -> dict:
+    digest = hashlib.sha256(recommendation.encode("utf-8")).digest()
+    return {
+        "relevance_score": digest[0] % 5 + 1,
+        "transparency_score": digest[1] % 5 + 1,
+        "persuasiveness_score": digest[2] % 5 + 1,
+        "reasoning": "Fake judgement.",
+    }
+
+
+def fake_judgement(prompt: str) -> dict:
+    """Judge answer for a per-item prompt, or an `evaluations` array for a batched one."""
+    role = ROLE_RE.search(prompt)
+    role = role.group(1) if role else ""
+    recommendations = [role + r for r in RECOMMENDATION_RE.findall(prompt)]
+    if '"evaluations"' not in prompt:
+        return _fake_scores(recommendations[0] if recommendations else prompt)
+    return {"evaluations": [{"recommendation": i + 1, **_fake_scores(r)} for i, r in enumerate(recommendations)]}
+
+
+class _FakeModels:
+    def __init__(self, latency: float, error_rate: float, malformed_rate: float):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.malformed_rate = malformed_rate
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def generate_content(self, model: str, contents: str, config=None):
+        with self._lock:
+            self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if random.random() < self.error_rate:
+            code, status = random.choice([(429, "RESOURCE_EXHAUSTED"), (503, "UNAVAILABLE")])
+            raise FakeJudgeError(code, status)
+        judgement = fake_judgement(contents)
+        if "evaluations" in judgement and random.random() < self.malformed_rate:
+            judgement["evaluations"].pop()
+        text = json.dumps(judgement)
+        usage = SimpleNamespace(prompt_token_count=estimate_tokens(contents), candidates_token_count=estimate_tokens(text))
+        return SimpleNamespace(text=text, usage_metadata=usage)
+
+
+class FakeJudgeClient:
+    def __init__(self, latency: float = 0.0, error_rate: float = 0.0, malformed_rate: float = 0.0):
+        self.models = _FakeModels(latency, error_rate, malformed_rate)
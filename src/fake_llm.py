@@ -0,0 +1,160 @@
+"""
+Local fake OpenAI-compatible server for exercising the pipeline without API costs.
+
+It answers POST /v1/chat/completions by picking the first FINAL_K candidate recipe ids
+found in the prompt, and can inject latency and 429/500 errors to test concurrency,
+rate limiting and retries. Streaming requests (`stream: true`) are answered with SSE chunks.
+
+Usage:
+    python src/fake_llm.py --port 8000 --latency 0.5 --error-rate 0.2
+    OPENAI_BASE_URL=http://127.0.0.1:8000/v1 OPENAI_API_KEY=fake python src/recommender.py
+"""
+import re
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from config import FINAL_K
+
+RECIPE_ID_RE = re.compile(r'"recipe_id":\s*"([^"]+)"')
+COMPACT_ROW_ID_RE = re.compile(r'^([^|\s]+)\|', re.MULTILINE)  # PROMPT_FORMAT = "compact"
+STREAM_CHUNK_CHARS = 16
+
+
+def fake_completion_content(prompt: str) -> str:
+    """A valid Stage 2 answer recommending the first FINAL_K candidates in the prompt."""
+    ids = RECIPE_ID_RE.findall(prompt) or COMPACT_ROW_ID_RE.findall(prompt)
+    ids = list(dict.fromkeys(ids))[:FINAL_K]
+    return json.dumps({
+        "recommendations": [
+            {"recipe_id": rid, "explanation": f"Fake explanation for recipe {rid}: it fits your goal."}
+            for rid in ids
+        ]
+    })
+
+
+class FakeLLMHandler(BaseHTTPRequestHandler):
+    latency = 0.0
+    error_rate = 0.0
+    stats = {"requests": 0, "errors": 0}
+    _lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        pass  # Keep the recommender's console output readable
+
+    def _send_json(self, status: int, payload: dict, headers: dict = None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+            return
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+
+        with self._lock:
+            self.stats["requests"] += 1
+            fail = random.random() < self.error_rate
+            if fail:
+                self.stats["errors"] += 1
+
+        if fail:
+            time.sleep(self.latency)
+            status = random.choice([429, 500])
+            self._send_json(status, {"error": {"message": "Injected failure", "type": "fake_error"}},
+                            headers={"Retry-After": "0.1"} if status == 429 else None)
+            return
+
+        prompt = "\n".join(m.get("content") or "" for m in request.get("messages", []))
+        content = fake_completion_content(prompt)
+        prompt_tokens = len(prompt) // 4 + 1
+        completion_tokens = len(content) // 4 + 1
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
+        if request.get("stream"):
+            self._stream(request, content, usage)
+            return
+
+        time.sleep(self.latency)
+        self._send_json(200, {
+            "id": f"chatcmpl-fake-{self.stats['requests']}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "fake"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }],
+            "usage": usage,
+        })
+
+    def _stream(self, request: dict, content: str, usage: dict):
+        """Server-sent events in `chat.completion.chunk` format; the latency is spread over the chunks."""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+
+        base = {"id": f"chatcmpl-fake-{self.stats['requests']}", "object": "chat.completion.chunk",
+                "created": int(time.time()), "model": request.get("model", "fake")}
+        pieces = [content[i:i + STREAM_CHUNK_CHARS] for i in range(0, len(content), STREAM_CHUNK_CHARS)]
+        events = [
+            dict(base, choices=[{"index": 0, "delta": {"role": "assistant", "content": piece}, "finish_reason": None}])
+            for piece in pieces
+        ]
+        events.append(dict(base, choices=[{"index": 0, "delta": {}, "finish_reason": "stop"}]))
+        if (request.get("stream_options") or {}).get("include_usage"):
+            events.append(dict(base, choices=[], usage=usage))
+
+        for event in events:
+            time.sleep(self.latency / len(pieces) if event["choices"] and event["choices"][0]["delta"] else 0)
+            self.wfile.write(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+
+def start_fake_server(port: int = 0, latency: float = 0.0, error_rate: float = 0.0):
+    """
+    Starts the fake server on a background thread.
+    Returns (server, base_url); call server.shutdown() when done.
+    """
+    handler = type("ConfiguredFakeLLMHandler", (FakeLLMHandler,), {
+        "latency": latency,
+        "error_rate": error_rate,
+        "stats": {"requests": 0, "errors": 0},
+    })
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds to wait before each response")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with 429/500")
+    args = parser.parse_args()
+
+    server, base_url = start_fake_server(args.port, args.latency, args.error_rate)
+    print(f"Fake OpenAI-compatible server listening on {base_url} (Ctrl+C to stop)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -4,7 +4,6 @@ import random
 from typing import List, Dict
 from pathlib import Path
 from dotenv import load_dotenv
-from openai import OpenAI
 
 # Load environment variables
 load_dotenv()
@@ -14,8 +13,16 @@ OUTPUT_DIR = Path(__file__).parent.parent / "data" / "output"
 OUTPUT_FILE = OUTPUT_DIR / "personas.json"
 NUM_PERSONAS = 10
 
-# Initialize client
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+_client = None
+
+def get_client():
+    """The OpenAI client, created on first use (importing this module stays cheap)."""
+    global _client
+    if _client is None:
+        from openai import OpenAI
+
+        _client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    return _client
 
 def generate_diverse_personas(n: int = 10) -> List[Dict]:
     """
@@ -66,7 +73,7 @@ def generate_diverse_personas(n: int = 10) -> List[Dict]:
     """
 
     try:
-        response = client.chat.completions.create(
+        response = get_client().chat.completions.create(
             model="gpt-5.2",  # or gpt-4o or gpt-5.2-mini
             messages=[
                 {"role": "system", "content": system_prompt},
@@ -1,6 +1,5 @@
 import json
 import csv
-import pandas as pd
 from pathlib import Path
 
 # --- Configuration ---
@@ -85,6 +84,8 @@ def convert_to_csv():
 
     # 4. Save to CSV
     if csv_rows:
+        import pandas as pd  # Only needed here; keeps the script's startup fast
+
         df = pd.DataFrame(csv_rows)
         df.to_csv(OUTPUT_CSV, index=False)
         print(f"\n Success! CSV saved to: {OUTPUT_CSV}")
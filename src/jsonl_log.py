@@ -0,0 +1,75 @@
+import os
+import json
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterator
+
+
+class JsonlWriter:
+    """
+    Append-only JSON Lines log. Every record is flushed and fsync'ed as soon as it is
+    written, so a crash loses at most the record being written. Thread-safe.
+    """
+
+    def __init__(self, path: Path, append: bool = True):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if append:
+            repair_jsonl(self.path)
+        self._file = open(self.path, "a" if append else "w", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def write(self, record: Dict[str, Any]):
+        line = json.dumps(record) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def repair_jsonl(path: Path):
+    """Drops a partially written last line (left by a crash) so appends stay valid."""
+    path = Path(path)
+    if not path.exists() or path.stat().st_size == 0:
+        return
+    with open(path, "rb+") as f:
+        end = f.seek(0, os.SEEK_END)
+        f.seek(end - 1)
+        if f.read(1) == b"\n":
+            return
+        # Scan backwards for the last complete line
+        pos = end
+        while pos > 0:
+            start = max(0, pos - 65536)
+            f.seek(start)
+            newline = f.read(pos - start).rfind(b"\n")
+            if newline >= 0:
+                pos = start + newline + 1
+                break
+            pos = start
+        f.truncate(pos)
+    print(f"⚠️ Warning: Dropped a partially written record at the end of {path}.")
+
+
+def read_jsonl(path: Path) -> Iterator[Dict[str, Any]]:
+    """Yields records one at a time; a truncated or corrupt line is skipped with a warning."""
+    path = Path(path)
+    if not path.exists():
+        return
+    with open(path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                print(f"⚠️ Warning: Skipping unreadable line {line_no} in {path}.")
@@ -0,0 +1,40 @@
+import json
+import argparse
+from pathlib import Path
+
+from jsonl_log import read_jsonl
+from config import RECOMMENDATIONS_FILE, RECOMMENDATIONS_STREAM_FILE
+
+
+def convert_jsonl_to_json(jsonl_path: Path, json_path: Path) -> int:
+    """
+    Streams a JSON Lines file into a single JSON array, record by record. The output is
+    byte-identical to `json.dump(records, f, indent=2)`, which downstream scripts expect.
+    Returns the number of records written.
+    """
+    count = 0
+    with open(json_path, 'w') as out:
+        out.write("[")
+        for record in read_jsonl(jsonl_path):
+            item = json.dumps(record, indent=2).replace("\n", "\n  ")
+            out.write((",\n  " if count else "\n  ") + item)
+            count += 1
+        out.write("\n]" if count else "]")
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert streamed recommendations (JSONL) to the single-JSON format.")
+    parser.add_argument("--input", type=Path, default=RECOMMENDATIONS_STREAM_FILE)
+    parser.add_argument("--output", type=Path, default=RECOMMENDATIONS_FILE)
+    args = parser.parse_args()
+
+    if not args.input.exists():
+        print(f"Error: {args.input} not found.")
+        return
+    count = convert_jsonl_to_json(args.input, args.output)
+    print(f"✅ Converted {count} records: {args.input} -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+import json
+import functools
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Optional, Tuple
+
+from rate_limit import estimate_tokens
+
+# Columns sent to the LLM. Passing nutritional data allows it to reason about
+# "Muscle Gain" (Protein) or "Weight Loss" (Calories).
+JSON_COLUMNS = [
+    'recipe_id', 'title', 'ingredients_title',
+    'calories_per_serving [cal]',
+    'protein_per_serving [g]',
+    'totalcarbohydrate_per_serving [g]',
+    'totalfat_per_serving [g]',
+    'tags'
+]
+
+# (alias shown to the LLM, catalog column); numeric columns are rendered with %g
+COMPACT_COLUMNS = [
+    ("id", "recipe_id"),
+    ("title", "title"),
+    ("kcal", "calories_per_serving [cal]"),
+    ("protein_g", "protein_per_serving [g]"),
+    ("carbs_g", "totalcarbohydrate_per_serving [g]"),
+    ("fat_g", "totalfat_per_serving [g]"),
+    ("tags", "tags"),
+    ("ingredients", "ingredients_title"),
+]
+
+
+@functools.lru_cache(maxsize=None)
+def _tiktoken_encoding(model: str):
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
+    except Exception as e:  # The encoding file is downloaded on first use, e.g. offline
+        print(f"⚠️ Warning: tiktoken encoding unavailable ({e}); token counts are estimated.")
+        return None
+
+
+def token_counts_are_exact(model: str) -> bool:
+    """False when `count_tokens` falls back to the estimate (tiktoken not installed)."""
+    return _tiktoken_encoding(model) is not None
+
+
+def token_count_source(model: str) -> str:
+    """Short label for reports: the tokenizer used, or that counts are estimated."""
+    if token_counts_are_exact(model):
+        return f"tokenizer for {model}"
+    return "estimated at ~4 chars/token (tiktoken not installed)"
+
+
+def count_tokens(text: str, model: str) -> int:
+    """Exact token count when `tiktoken` is installed, otherwise a ~4 chars/token estimate."""
+    encoding = _tiktoken_encoding(model)
+    if encoding is None:
+        return estimate_tokens(text)
+    return len(encoding.encode(text))
+
+
+def _cell(value, max_items: Optional[int] = None) -> str:
+    """One table cell: lists joined with ';' (optionally truncated), no separator characters."""
+    if isinstance(value, (list, tuple, np.ndarray)):
+        items = [str(v) for v in value]
+        if max_items is not None and len(items) > max_items:
+            items = items[:max_items] + [f"+{len(items) - max_items} more"]
+        text = ";".join(items)
+    elif isinstance(value, (float, np.floating)):
+        text = "" if pd.isna(value) else f"{value:g}"
+    else:
+        text = "" if value is None else str(value)
+    return text.replace("|", "/").replace("\n", " ")
+
+
+def compact_candidate_rows(candidates: pd.DataFrame, max_ingredients: Optional[int] = None) -> List[str]:
+    """One '|'-separated row per candidate, columns in COMPACT_COLUMNS order."""
+    columns = [candidates[col].tolist() if col in candidates.columns else [None] * len(candidates)
+               for _, col in COMPACT_COLUMNS]
+    return [
+        "|".join(_cell(v, max_ingredients if alias == "ingredients" else None)
+                 for (alias, _), v in zip(COMPACT_COLUMNS, values))
+        for values in zip(*columns)
+    ]
+
+
+def build_json_user_prompt(user_profile: Dict, candidates: pd.DataFrame) -> Tuple[str, int]:
+    """
+    Original Stage 2 user prompt: profile and candidate records as indented JSON.
+    Returns (prompt, number of candidates included).
+    """
+    candidates_json = candidates[JSON_COLUMNS].to_dict(orient='records')
+
+    for rec in candidates_json:
+        for key, val in rec.items():
+            if isinstance(val, np.ndarray):
+                rec[key] = val.tolist()
+
+    user_prompt = f"""
+        User Profile: {json.dumps(user_profile, indent=2)}       
+        Candidates: {json.dumps(candidates_json, indent=2)}
+        """
+    return user_prompt, len(candidates_json)
+
+
+def build_compact_user_prompt(user_profile: Dict, candidates: pd.DataFrame, model: str,
+                              max_ingredients: Optional[int] = None,
+                              token_budget: Optional[int] = None) -> Tuple[str, int]:
+    """
+    Compact Stage 2 user prompt: the profile as minified JSON and the candidates as a
+    table with short column aliases. With `token_budget`, candidates are dropped from the
+    tail (lowest Stage 1 similarity) until the prompt fits.
+    Returns (prompt, number of candidates included).
+    """
+    legend = "|".join(alias for alias, _ in COMPACT_COLUMNS)
+    header = (
+        f"User Profile: {json.dumps(user_profile, separators=(',', ':'))}\n"
+        f"Candidates (one per line, columns {legend}; id is the recipe_id; lists use ';'):\n"
+    )
+    rows = compact_candidate_rows(candidates, max_ingredients)
+
+    if token_budget is not None:
+        used = count_tokens(header, model)
+        for n_rows, row in enumerate(rows):
+            used += count_tokens(row + "\n", model)
+            if used > token_budget:
+                rows = rows[:n_rows]
+                break
+
+    return header + "\n".join(rows), len(rows)
@@ -0,0 +1,139 @@
+import time
+import random
+import threading
+from typing import Callable, Optional
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token), good enough for rate-limit budgeting."""
+    return len(text) // 4 + 1
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket refilled continuously at `rate_per_minute`.
+    A falsy rate disables limiting.
+    """
+
+    def __init__(self, rate_per_minute: Optional[float], capacity: Optional[float] = None):
+        self.rate_per_minute = rate_per_minute
+        self.capacity = capacity or rate_per_minute or 0
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate_per_minute / 60.0)
+        self._updated = now
+
+    def set_rate(self, rate_per_minute: float):
+        """Changes the refill rate from now on; tokens accrued so far are kept."""
+        with self._lock:
+            self._refill()
+            self.rate_per_minute = rate_per_minute
+
+    def acquire(self, amount: float = 1.0):
+        """Blocks until `amount` tokens are available, then takes them."""
+        if not self.rate_per_minute:
+            return
+        amount = min(amount, self.capacity)  # Oversized requests would otherwise wait forever
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= amount:
+                    self._tokens -= amount
+                    return
+                wait = (amount - self._tokens) * 60.0 / self.rate_per_minute
+            time.sleep(wait)
+
+
+class RateLimiter:
+    """Requests-per-minute and tokens-per-minute budgets shared by all worker threads."""
+
+    def __init__(self, requests_per_minute: Optional[float] = None, tokens_per_minute: Optional[float] = None):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+
+    def acquire(self, tokens: int = 0):
+        self.requests.acquire(1)
+        if tokens:
+            self.tokens.acquire(tokens)
+
+
+class AdaptiveRateLimiter:
+    """
+    Requests-per-minute limiter that slows down for every worker when the server reports a
+    quota error: the rate is halved (at most once per `cooldown` seconds, never below
+    `min_fraction` of the configured rate) and the bucket is drained. Each success then
+    restores `recovery` of the configured rate, up to the configured rate.
+    """
+
+    def __init__(self, requests_per_minute: Optional[float], min_fraction: float = 0.1,
+                 recovery: float = 0.02, cooldown: float = 5.0):
+        self.max_rate = requests_per_minute
+        self.min_fraction = min_fraction
+        self.recovery = recovery
+        self.cooldown = cooldown
+        self.bucket = TokenBucket(requests_per_minute)
+        self.throttles = 0
+        self._last_throttle = float("-inf")
+        self._lock = threading.Lock()
+
+    @property
+    def rate(self) -> Optional[float]:
+        return self.bucket.rate_per_minute
+
+    def acquire(self):
+        self.bucket.acquire(1)
+
+    def on_quota_error(self):
+        if not self.max_rate:
+            return
+        with self._lock:
+            now = time.monotonic()
+            if now - self._last_throttle < self.cooldown:
+                return
+            self._last_throttle = now
+            self.throttles += 1
+            self.bucket.set_rate(max(self.max_rate * self.min_fraction, self.rate / 2))
+            with self.bucket._lock:
+                self.bucket._tokens = 0
+
+    def on_success(self):
+        if not self.max_rate or self.rate >= self.max_rate:
+            return
+        with self._lock:
+            self.bucket.set_rate(min(self.max_rate, self.rate + self.max_rate * self.recovery))
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """Server-suggested delay (Retry-After header), if the error carries an HTTP response."""
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def call_with_retries(fn: Callable, is_retryable: Callable[[Exception], bool], max_retries: int = 5,
+                      base_delay: float = 1.0, max_delay: float = 60.0,
+                      on_retry: Optional[Callable[[Exception], None]] = None):
+    """
+    Calls `fn()`, retrying retryable errors with jittered exponential backoff
+    (or the server's Retry-After, when given). Other errors propagate immediately.
+    `on_retry(error)` is called before each retry, e.g. to slow down a shared limiter.
+    """
+    for attempt in range(max_retries + 1):
+        try:
+            return fn()
+        except Exception as e:
+            if attempt >= max_retries or not is_retryable(e):
+                raise
+            if on_retry is not None:
+                on_retry(e)
+            delay = _retry_after(e)
+            if delay is None:
+                delay = min(max_delay, base_delay * 2 ** attempt) * random.uniform(0.5, 1.0)
+            print(f"   ⚠️ {type(e).__name__} (attempt {attempt + 1}/{max_retries}); retrying in {delay:.1f}s...")
+            time.sleep(delay)
@@ -0,0 +1,79 @@
+import numpy as np
+import pandas as pd
+from typing import List
+
+# numpy print options that `str(ndarray)` output depends on; the fast formatter below
+# reproduces the output for these defaults only
+_NUMPY_STR_DEFAULTS = {"linewidth": 75, "threshold": 1000, "legacy": False, "formatter": None}
+
+
+def create_recipe_doc(row):
+    # Combine critical fields into one string for the Vector Engine
+    return (
+        f"Title: {row['title']}. "
+        f"Ingredients: {row.get('ingredients_title', row['ingredients'])}. "
+        f"Tags: {row.get('tags', '')}. "
+        f"Calories: {row.get('calories_per_serving [cal]', '')}."
+    )
+
+
+def _str_array_text(items: List[str]) -> str:
+    """
+    `str(np.array(items))` for a 1-D array of Python strings: elements as repr(), separated
+    by spaces, wrapped at numpy's default line width with a one-space hanging indent.
+    """
+    width = _NUMPY_STR_DEFAULTS["linewidth"] - len("]")
+    text, line = "", " "
+    last = len(items) - 1
+    for i, item in enumerate(items):
+        word = repr(item)
+        if len(line) + len(word) > width and len(line) > 1:
+            text += line.rstrip() + "\n"
+            line = " "
+        line += word
+        if i < last:
+            line += " "
+    return "[" + (text + line)[1:] + "]"
+
+
+def _format_cells(values, fast: bool) -> List[str]:
+    """f-string text of every cell; string arrays go through `_str_array_text` (memoized)."""
+    if not fast:
+        return [f"{v}" for v in values]
+    seen = {}
+    out = []
+    for value in values:
+        if isinstance(value, np.ndarray):
+            items = value.tolist() if value.ndim == 1 and value.size <= _NUMPY_STR_DEFAULTS["threshold"] else None
+            if items is not None and all(type(item) is str for item in items):
+                key = tuple(items)
+                text = seen.get(key)
+                if text is None:
+                    text = seen[key] = _str_array_text(items)
+                out.append(text)
+                continue
+        out.append(f"{value}")
+    return out
+
+
+def build_recipe_docs(df: pd.DataFrame) -> List[str]:
+    """
+    Column-wise equivalent of `df.apply(create_recipe_doc, axis=1).tolist()`, with
+    byte-identical output: each column is formatted once (array cells reproduce numpy's
+    `str(ndarray)` layout) and the pieces are concatenated per row.
+    """
+    options = np.get_printoptions()
+    fast = all(options[key] == value for key, value in _NUMPY_STR_DEFAULTS.items())
+
+    n = len(df)
+    ingredients_col = 'ingredients_title' if 'ingredients_title' in df.columns else 'ingredients'
+    titles = _format_cells(df['title'].tolist(), fast)
+    ingredients = _format_cells(df[ingredients_col].tolist(), fast)
+    tags = _format_cells(df['tags'].tolist(), fast) if 'tags' in df.columns else [''] * n
+    calories = (_format_cells(df['calories_per_serving [cal]'].tolist(), fast)
+                if 'calories_per_serving [cal]' in df.columns else [''] * n)
+
+    return [
+        f"Title: {t}. Ingredients: {i}. Tags: {g}. Calories: {c}."
+        for t, i, g, c in zip(titles, ingredients, tags, calories)
+    ]
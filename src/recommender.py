@@ -1,61 +1,389 @@
+import gc
 import json
+import argparse
+import threading
 import numpy as np
 import pandas as pd
-from typing import List, Dict, Any
-from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
-from openai import OpenAI
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Dict, Any, Iterator, Optional
+
+from embedding_store import EmbeddingStore, QueryEmbeddingCache
+from recipe_docs import build_recipe_docs
+from constraint_index import ConstraintIndex, preference_term, restriction_rule
+from lru_cache import LRUCache
+from vector_index import SparseBias, build_index, l2_normalize
+from rate_limit import RateLimiter, call_with_retries, estimate_tokens
+from jsonl_log import JsonlWriter, read_jsonl
+from jsonl_to_json import convert_jsonl_to_json
+from response_cache import ResponseCache
+from stream_parser import RecommendationStreamParser
+from reranker import local_rerank
+from prompt_encoding import build_compact_user_prompt, build_json_user_prompt, count_tokens, token_counts_are_exact
 
 from config import (
     RECIPES_FILE, 
     PERSONAS_FILE, 
     RECOMMENDATIONS_FILE,
+    RECOMMENDATIONS_STREAM_FILE,
+    EMBEDDING_CACHE_FILE,
     EMBEDDING_MODEL_NAME, 
     LLM_MODEL_NAME,
     CONSIDERATION_SET_SIZE,
-    FINAL_K
+    FINAL_K,
+    VECTOR_INDEX_FILE,
+    VECTOR_INDEX_TYPE,
+    IVF_N_LISTS,
+    IVF_N_PROBE,
+    QUANTIZATION,
+    QUANTIZED_RESCORE,
+    RESCORE_FACTOR,
+    SAFE_SET_CACHE_SIZE,
+    QUERY_CACHE_FILE,
+    QUERY_CACHE_SIZE,
+    QUERY_CACHE_PERSIST,
+    STAGE1_BATCH_SIZE,
+    DISLIKED_PENALTY_WEIGHT,
+    CATALOG_COMPACT_FRACTION,
+    LOCAL_RERANK_SIZE,
+    LOCAL_RERANK_WEIGHTS,
+    PROMPT_FORMAT,
+    PROMPT_MAX_INGREDIENTS,
+    PROMPT_TOKEN_BUDGET,
+    LLM_CACHE_FILE,
+    LLM_CACHE_ENABLED,
+    LLM_CACHE_TTL_SECONDS,
+    LLM_CACHE_MAX_ENTRIES,
+    LLM_MAX_CONCURRENCY,
+    LLM_REQUESTS_PER_MINUTE,
+    LLM_TOKENS_PER_MINUTE,
+    LLM_MAX_OUTPUT_TOKENS_ESTIMATE,
+    LLM_MAX_RETRIES,
+    LLM_BACKOFF_BASE_SECONDS,
+    LLM_BACKOFF_MAX_SECONDS
+)
+
+# Array-valued columns; parquet loads these as object ndarrays, and the semantic docs
+# embed their numpy repr, so incoming rows must use the same representation.
+LIST_COLUMNS = ['ingredients_title', 'tags']
+
+# Columns the engine reads from RECIPES_FILE. 'ingredients' (the raw nested ingredient list)
+# is only needed to build the document text and the constraint index, then dropped.
+RECIPE_COLUMNS = [
+    'recipe_id', 'title', 'ingredients', 'ingredients_title', 'tags',
+    'calories_per_serving [cal]',
+    'protein_per_serving [g]',
+    'totalcarbohydrate_per_serving [g]',
+    'totalfat_per_serving [g]'
+]
+TRANSIENT_COLUMNS = ['ingredients']
+
+
+def load_recipes(path) -> pd.DataFrame:
+    """Reads only the RECIPE_COLUMNS present in the parquet file; recipe_id as str."""
+    import pyarrow.parquet as pq
+
+    available = set(pq.read_schema(path).names)
+    df = pd.read_parquet(path, columns=[c for c in RECIPE_COLUMNS if c in available])
+    df['recipe_id'] = df['recipe_id'].astype(str)
+    return df
+
+
+def compact_recipe_layout(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Long-lived in-memory layout: transient columns dropped, ids/titles as Arrow strings and
+    ingredient/tag lists as Arrow list<string> (cells read back as Python lists).
+    Apply after the document texts and the constraint index have been built, since those
+    depend on the original numpy representation of the list columns.
+    """
+    import pyarrow as pa
+
+    df = df.drop(columns=[c for c in TRANSIENT_COLUMNS if c in df.columns])
+    for col in ['recipe_id', 'title']:
+        if col in df.columns:
+            df[col] = df[col].astype(pd.StringDtype("pyarrow"))
+    for col in LIST_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype(pd.ArrowDtype(pa.list_(pa.string())))
+    return df
+
+
+def release_unused_memory():
+    """Returns memory freed by the loader (Arrow buffers, transient columns) to the OS."""
+    import pyarrow as pa
+
+    gc.collect()
+    pa.default_memory_pool().release_unused()
+
+
+def _is_retryable_llm_error(error: Exception) -> bool:
+    """Rate limits (429), server errors (5xx) and connection problems are worth retrying."""
+    from openai import APIConnectionError, APIStatusError
+
+    if isinstance(error, APIStatusError):
+        return error.status_code == 429 or error.status_code >= 500
+    return isinstance(error, APIConnectionError)
+
+STAGE_2_SYSTEM_PROMPT = (
+    "You are an AI-powered food recommendation assistant. "
+    "You will receive a list of candidate recipes that has already been filtered by a hard-constraint "
+    "('Never List') module to remove items that violate the user's dietary restrictions and allergies.\n\n"
+
+    "Your task is to rank the remaining candidates and return the TOP 6 recipes, balancing two goals:\n"
+    "(A) match the user's profile (goal + tastes) and\n"
+    "(B) gently prefer healthier options when it does not significantly reduce profile match.\n\n"
+
+    "IMPORTANT RULES:\n"
+    "- Do NOT reveal internal reasoning steps.\n"
+    "- Base explanations only on the provided user profile and recipe metadata.\n"
+    "- Do not invent nutrition facts or health claims that are not supported by the provided data.\n"
+    "- Do not provide medical advice.\n\n"
+
+    "INTERNAL RANKING PRINCIPLES (apply silently):\n"
+    "1. PRIMARY: PROFILE FIT. Prioritize recipes that best match the user's goal and preferences "
+    "(liked ingredients/cuisines, avoid disliked ingredients, dietaryProfile (dietaryRestrictions, foodAllergies, healthConditions)).\n"
+    "2. SECONDARY: HEALTHIER BIAS. When two recipes are similarly good for the user, rank the healthier-leaning one higher "
+    "(e.g., more nutrient-dense, more balanced macros, less excessive sugar/sodium/saturated fat—based only on provided data).\n"
+
+    "EXPLANATION REQUIREMENTS (user-visible):\n"
+    "- TRANSPARENCY: Explicitly cite at least one user factor that drove the choice (goal or preference). This Transparency aims to evaluate “whether the explanations can reveal the internal working principles of the recommender models\n"
+    "- HEALTH JUSTIFICATION: If the recipe is a healthier-leaning pick (or chosen over a similar option), briefly mention the relevant nutrition cue "
+    "(e.g., 'higher protein', 'more balanced meal', 'includes vegetables/whole grains', 'lower added sugar') without overstating.\n"
+    "- PERSUASIVENESS: Use motivating, non-clinical language that encourages trying the recipe. This Persuasiveness aims to evaluate “whether the explanations can increase the interaction probability of the users on the items.\n"
+    "- Keep each explanation short (3–4 sentences).\n\n"
+
+    "Output strictly valid JSON in this format:\n"
+    "{ 'recommendations': [ { 'recipe_id': '...', 'explanation': '...' } ] }"
 )
 
 class XFoodRecommender:
-    def __init__(self):
+    def __init__(self, use_response_cache: bool = LLM_CACHE_ENABLED):
         """
         Initializes the Hybrid Recommender Engine.
+        Set `use_response_cache=False` to bypass the Stage 2 response cache.
         """
-        print(f"Loading embedding model: {EMBEDDING_MODEL_NAME}...")
-        self.encoder = SentenceTransformer(EMBEDDING_MODEL_NAME)
-        
+        # The embedding model and the OpenAI client are created on first use: with warm
+        # embedding/response caches a run may never need them.
+        self._encoder = None
+        self._client = None
+        self._lazy_lock = threading.Lock()
+
         print(f"Loading recipe data from {RECIPES_FILE}...")
         try:
-            self.recipes_df = pd.read_parquet(RECIPES_FILE)
-
-            # To ensure ID is always a string
-            self.recipes_df['recipe_id'] = self.recipes_df['recipe_id'].astype(str)
+            recipes_df = load_recipes(RECIPES_FILE)
 
             print("Generating recipe embeddings (Title + Ingredients + Tags)...")
             
-            def create_recipe_doc(row):
-                # Combine critical fields into one string for the Vector Engine
-                return (
-                    f"Title: {row['title']}. "
-                    f"Ingredients: {row.get('ingredients_title', row['ingredients'])}. "
-                    f"Tags: {row.get('tags', '')}. "
-                    f"Calories: {row.get('calories_per_serving [cal]', '')}."
-                )
+            # Document texts are transient: only needed for embedding
+            semantic_docs = build_recipe_docs(recipes_df)
             
-            # Create a temporary column for embedding
-            self.recipes_df['semantic_doc'] = self.recipes_df.apply(create_recipe_doc, axis=1)
-            
-            self.recipe_embeddings = self.encoder.encode(
-                self.recipes_df['semantic_doc'].tolist(), 
-                show_progress_bar=True,
-                convert_to_numpy=True
+            # Only recipes whose doc text changed since the last run are re-encoded.
+            # Vectors are stored L2-normalized so retrieval is a single dot product.
+            store = EmbeddingStore(EMBEDDING_CACHE_FILE, EMBEDDING_MODEL_NAME, normalize=True)
+            self.recipe_embeddings = store.get_or_compute(
+                semantic_docs,
+                lambda docs: self.encoder.encode(docs, show_progress_bar=True, convert_to_numpy=True)
             )
+            del semantic_docs
         except FileNotFoundError:
             raise FileNotFoundError(f"Could not find {RECIPES_FILE}.")
 
-        self.client = OpenAI()
+        print("Building hard-constraint index...")
+        self.constraint_index = ConstraintIndex(recipes_df)
+        self.recipes_df = compact_recipe_layout(recipes_df)
+        del recipes_df
+        release_unused_memory()
 
-    def _create_user_vector_query(self, profile: Dict) -> np.ndarray:
+        # Row position == DataFrame index label == embedding row. Deleted recipes are
+        # tombstoned in `active_mask` so positions stay put until `compact()` renumbers them.
+        self.recipe_id_to_pos = {rid: pos for pos, rid in enumerate(self.recipes_df['recipe_id'])}
+        self.active_mask = np.ones(len(self.recipes_df), dtype=bool)
+        self._embedding_buffer = None
+        # Row position -> display card (title, ingredient list, formatted nutrition), built on first use
+        self._cards = {}
+
+        # Normalized dietary profile -> safe mask; cleared whenever the catalog changes
+        self.safe_set_cache = LRUCache(SAFE_SET_CACHE_SIZE)
+
+        # Query text -> embedding; repeat profiles skip the encoder entirely
+        self.query_cache = QueryEmbeddingCache(QUERY_CACHE_SIZE, EMBEDDING_MODEL_NAME)
+        if QUERY_CACHE_PERSIST:
+            self.query_cache.load(QUERY_CACHE_FILE)
+
+        index_params = {
+            "ivf": {"n_lists": IVF_N_LISTS, "n_probe": IVF_N_PROBE},
+            "quantized": {"quantization": QUANTIZATION, "rescore": QUANTIZED_RESCORE, "rescore_factor": RESCORE_FACTOR},
+        }.get(VECTOR_INDEX_TYPE, {})
+        self.vector_index = build_index(
+            VECTOR_INDEX_TYPE, self.recipe_embeddings, VECTOR_INDEX_FILE, store.fingerprint, **index_params
+        )
+
+        self.rate_limiter = RateLimiter(LLM_REQUESTS_PER_MINUTE, LLM_TOKENS_PER_MINUTE)
+        self.token_usage = {"requests": 0, "prompt": 0, "completion": 0}
+        self._usage_lock = threading.Lock()
+        self.response_cache = ResponseCache(
+            LLM_CACHE_FILE, LLM_CACHE_TTL_SECONDS, LLM_CACHE_MAX_ENTRIES, enabled=use_response_cache
+        )
+
+    @property
+    def encoder(self):
+        if self._encoder is None:
+            with self._lazy_lock:
+                if self._encoder is None:
+                    from sentence_transformers import SentenceTransformer
+
+                    print(f"Loading embedding model: {EMBEDDING_MODEL_NAME}...")
+                    self._encoder = SentenceTransformer(EMBEDDING_MODEL_NAME)
+        return self._encoder
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lazy_lock:
+                if self._client is None:
+                    from openai import OpenAI
+
+                    # Retries are handled by `_request` (with backoff), so the SDK's own are disabled.
+                    # OPENAI_BASE_URL can point the client at a local fake server (see fake_llm.py).
+                    self._client = OpenAI(max_retries=0)
+        return self._client
+
+    @client.setter
+    def client(self, client):
+        self._client = client
+
+    def _reserve_embedding_rows(self, n_new: int):
+        """
+        Makes room for `n_new` appended embedding rows. The buffer grows geometrically,
+        so appends cost O(delta) amortized; `recipe_embeddings` stays a view of the live rows.
+        Updates alone write into the copy-on-write map of the cache file (only the touched
+        pages get private copies); the first insert copies the float32 matrix into RAM.
+        """
+        n_rows, dim = self.recipe_embeddings.shape
+        if n_new == 0 and self.recipe_embeddings.flags.writeable:
+            return
+        if self._embedding_buffer is None or len(self._embedding_buffer) < n_rows + n_new:
+            capacity = n_rows if n_new == 0 else max(2 * n_rows, n_rows + n_new, 16)
+            buffer = np.empty((capacity, dim), dtype=np.float32)
+            buffer[:n_rows] = self.recipe_embeddings
+            self._embedding_buffer = buffer
+        self.recipe_embeddings = self._embedding_buffer[:n_rows + n_new]
+
+    def upsert_recipes(self, recipes) -> Dict[str, int]:
+        """
+        Inserts new recipes or replaces existing ones (matched by recipe_id) on the live engine.
+        Only the given rows are re-embedded. Accepts a DataFrame or a list of dicts with the
+        same columns as recipes.parquet.
+        """
+        new_df = pd.DataFrame(recipes).copy()
+        if new_df.empty:
+            return {"inserted": 0, "updated": 0}
+
+        new_df['recipe_id'] = new_df['recipe_id'].astype(str)
+        new_df = new_df.drop_duplicates('recipe_id', keep='last').reset_index(drop=True)
+        for col in LIST_COLUMNS:
+            if col in new_df.columns:
+                new_df[col] = [
+                    np.array(v, dtype=object) if isinstance(v, (list, tuple)) else v
+                    for v in new_df[col]
+                ]
+
+        new_embeddings = l2_normalize(
+            self.encoder.encode(build_recipe_docs(new_df), convert_to_numpy=True)
+        )
+        new_layout = compact_recipe_layout(new_df)
+        new_layout = new_layout[[c for c in self.recipes_df.columns if c in new_layout.columns]]
+
+        existing = new_df['recipe_id'].map(self.recipe_id_to_pos)
+        is_update = existing.notna().to_numpy()
+        update_pos = existing[is_update].astype(int).to_numpy()
+        start = len(self.recipes_df)
+        insert_pos = np.arange(start, start + int((~is_update).sum()))
+        changed_pos = np.concatenate([update_pos, insert_pos])
+
+        # Build the new catalog frame aside (copy-on-write: only the touched columns are
+        # copied), so nothing on the engine changes until every input has been processed.
+        recipes_df = self.recipes_df.copy(deep=False)
+        if is_update.any():
+            # Replace existing rows in place (also revives tombstoned ids)
+            updates = new_layout[is_update]
+            for col in updates.columns:
+                recipes_df.iloc[update_pos, recipes_df.columns.get_loc(col)] = updates[col].array
+        if len(insert_pos):
+            # Append new rows at the end so existing positions are untouched
+            inserts = new_layout[~is_update]
+            recipes_df = pd.concat([recipes_df, inserts.set_index(pd.Index(insert_pos))])
+
+        try:
+            # Reads all its inputs before modifying anything, so it goes first
+            self.constraint_index.update(changed_pos, pd.concat([new_df[is_update], new_df[~is_update]]))
+
+            self.recipes_df = recipes_df
+            self._reserve_embedding_rows(len(insert_pos))
+            self.recipe_embeddings[changed_pos] = np.concatenate([new_embeddings[is_update], new_embeddings[~is_update]])
+            self.active_mask[update_pos] = True
+            self.active_mask = np.concatenate([self.active_mask, np.ones(len(insert_pos), dtype=bool)])
+            self.recipe_id_to_pos.update(zip(new_layout['recipe_id'][~is_update], insert_pos.tolist()))
+
+            self.vector_index.update(self.recipe_embeddings, changed_pos)
+            for pos in changed_pos.tolist():
+                self._cards.pop(pos, None)
+        finally:
+            # Cached safe sets may predate a partially applied batch
+            self.safe_set_cache.clear()
+
+        stats = {"inserted": int((~is_update).sum()), "updated": int(is_update.sum())}
+        print(f"Catalog upsert: {stats['inserted']} inserted, {stats['updated']} updated.")
+        return stats
+
+    @property
+    def active_recipes(self) -> pd.DataFrame:
+        """The live catalog: `recipes_df` without retired (tombstoned) recipes."""
+        return self.recipes_df[self.active_mask]
+
+    def delete_recipes(self, recipe_ids: List[str]) -> int:
+        """
+        Retires recipes from the live engine by tombstoning them; they are excluded
+        from retrieval immediately. Unknown ids are ignored. Once tombstones exceed
+        CATALOG_COMPACT_FRACTION of the catalog, the engine is compacted.
+        """
+        positions = [self.recipe_id_to_pos.get(str(rid)) for rid in recipe_ids]
+        positions = [p for p in positions if p is not None and self.active_mask[p]]
+        self.active_mask[positions] = False
+        self.safe_set_cache.clear()
+        print(f"Catalog delete: {len(positions)} recipes retired.")
+        if CATALOG_COMPACT_FRACTION is not None and (~self.active_mask).mean() > CATALOG_COMPACT_FRACTION:
+            self.compact()
+        return len(positions)
+
+    def compact(self) -> int:
+        """
+        Drops retired recipes from the catalog, embeddings, constraint index and vector index,
+        renumbering the remaining rows (positions are only stable between compactions).
+        Returns the number of rows removed.
+        """
+        keep = np.flatnonzero(self.active_mask)
+        removed = len(self.active_mask) - len(keep)
+        if removed == 0:
+            return 0
+        new_pos = np.full(len(self.active_mask), -1, dtype=np.int64)
+        new_pos[keep] = np.arange(len(keep))
+
+        self.recipes_df = self.recipes_df.iloc[keep].reset_index(drop=True)
+        self._embedding_buffer = np.ascontiguousarray(self.recipe_embeddings[keep], dtype=np.float32)
+        self.recipe_embeddings = self._embedding_buffer[:len(keep)]
+        self.recipe_id_to_pos = {rid: pos for pos, rid in enumerate(self.recipes_df['recipe_id'])}
+        self.active_mask = np.ones(len(keep), dtype=bool)
+
+        self.constraint_index.compact(keep)
+        self.vector_index.compact(self.recipe_embeddings, keep)
+        self._cards = {int(new_pos[pos]): card for pos, card in self._cards.items() if new_pos[pos] >= 0}
+        self.safe_set_cache.clear()
+        release_unused_memory()
+
+        print(f"Catalog compaction: {removed} retired recipes dropped, {len(keep)} remain.")
+        return removed
+
+    def _user_query_text(self, profile: Dict) -> str:
         """
         Includes Goal, Cuisines, Likes, and Health Conditions for semantic matching.
         """
@@ -73,170 +401,242 @@ class XFoodRecommender:
             f"Preferences: {likes}. "
             f"Cuisine style: {cuisines}."
         )
-        return self.encoder.encode(text_query).reshape(1, -1)
+        return text_query
 
-    def _apply_hard_constraints(self, df: pd.DataFrame, profile: Dict) -> pd.DataFrame:
+    def _encode_queries(self, texts: List[str]) -> np.ndarray:
         """
-        Strict Hard Constraints
+        Returns one embedding row per query text. Cached texts are served from the query
+        cache; the rest are encoded together in a single encoder call.
+        """
+        vectors = [self.query_cache.get(text) for text in texts]
+        missing = list(dict.fromkeys(t for t, v in zip(texts, vectors) if v is None))
+        if missing:
+            encoded = np.asarray(self.encoder.encode(missing, convert_to_numpy=True), dtype=np.float32)
+            fresh = dict(zip(missing, encoded.reshape(len(missing), -1)))
+            for text, vector in fresh.items():
+                self.query_cache.put(text, vector)
+            vectors = [fresh[t] if v is None else v for t, v in zip(texts, vectors)]
+        return np.stack(vectors)
+
+    def _create_user_vector_query(self, profile: Dict) -> np.ndarray:
+        return self._encode_queries([self._user_query_text(profile)])
+
+    @staticmethod
+    def _diet_key(profile: Dict) -> tuple:
+        """
+        Canonical form of the parts of dietaryProfile that drive the hard filter: allergens
+        (case/order/duplicate-insensitive) and the restriction rules they map to.
+        Health conditions and unmapped restrictions do not change the safe set.
         """
-        filtered_df = df.copy()        
         diet_profile = profile['dietaryProfile']
-        
-        # 1. Allergy Filter
-        allergies = [a.lower() for a in diet_profile['foodAllergies']['selected']]
-        if allergies:
-            # Function to check if ANY allergy word appears in the ingredients string
-            def contains_allergen(ing_str):
-                ing_lower = str(ing_str).lower()
-                for allergen in allergies:
-                    if allergen in ing_lower:
-                        return True
-                return False
-            
-            # Keep rows that do NOT contain allergens
-            filtered_df = filtered_df[~filtered_df['ingredients'].apply(contains_allergen)]
+        allergies = sorted({a.lower() for a in diet_profile['foodAllergies']['selected']})
+        rules = {restriction_rule(r) for r in diet_profile['dietaryRestrictions']['selected']}
+        return tuple(allergies), tuple(sorted(rules - {None}))
 
-        # 2. Dietary Restrictions (e.g., Vegan, Vegetarian)
-        restrictions = [r.lower() for r in diet_profile['dietaryRestrictions']['selected']]
-        
-        # Map user restrictions to dataset tags (simple mapping logic)
-        for restriction in restrictions:
-            if 'vegan' in restriction:
-                # Filter rows where 'tags' column contains 'vegan' (case insensitive)
-                filtered_df = filtered_df[filtered_df['tags'].astype(str).str.lower().str.contains('vegan')]
-            elif 'vegetarian' in restriction:
-                filtered_df = filtered_df[filtered_df['tags'].astype(str).str.lower().str.contains('vegetarian')]
-            elif 'gluten' in restriction:
-                 # Check tags OR ingredients
-                 filtered_df = filtered_df[
-                     filtered_df['tags'].astype(str).str.lower().str.contains('gluten') |
-                     ~filtered_df['ingredients'].astype(str).str.lower().str.contains('flour|wheat|bread') 
-                 ]
-
-        return filtered_df
+    def _apply_hard_constraints(self, profile: Dict) -> np.ndarray:
+        """
+        Strict Hard Constraints, as a read-only boolean mask over catalog positions.
+        Combines precomputed masks from the constraint index; retired recipes are excluded.
+        Results are memoized per normalized dietary profile.
+        """
+        key = self._diet_key(profile)
+        safe_mask = self.safe_set_cache.get(key)
+        if safe_mask is None:
+            allergies, rules = key
+            safe_mask = self.constraint_index.safe_mask(allergies, rules) & self.active_mask
+            safe_mask.flags.writeable = False
+            self.safe_set_cache.put(key, safe_mask)
+        return safe_mask
+
+    def _dislike_penalty(self, profile: Dict) -> Optional[SparseBias]:
+        """
+        Soft penalty: -DISLIKED_PENALTY_WEIGHT for every disliked ingredient a catalog row
+        contains (precomputed, memoized ingredient masks), stored only for the rows it
+        touches. None if nothing applies.
+        """
+        terms = {preference_term(t) for t in profile.get('dislikedIngredients', []) if t and t.strip()}
+        if not terms or not DISLIKED_PENALTY_WEIGHT:
+            return None
+        hits = np.concatenate([np.flatnonzero(self.constraint_index.preference_mask(term)) for term in terms])
+        positions, counts = np.unique(hits, return_counts=True)
+        return SparseBias(positions, counts.astype(np.float32) * np.float32(-DISLIKED_PENALTY_WEIGHT))
 
     def stage_1_retrieval(self, user_profile: Dict) -> pd.DataFrame:
         """
         Hybrid Retrieval: Hard Filters -> Vector Search
         """
         # 1. Apply Hard Constraints FIRST (Safety First)
-        safe_recipes = self._apply_hard_constraints(self.recipes_df, user_profile)
+        safe_mask = self._apply_hard_constraints(user_profile)
         
-        if safe_recipes.empty:
+        if not safe_mask.any():
             print("Warning: Hard constraints removed all recipes. Relaxing filters...")
             
 
-        # 2. Vector Search on remaining candidates
-        safe_indices = safe_recipes.index
-        safe_embeddings = self.recipe_embeddings[safe_indices]
-        
+        # 2. Vector Search on remaining candidates (pre-filtered by the safe mask),
+        #    with recipes containing disliked ingredients pushed down
         user_vec = self._create_user_vector_query(user_profile)
-        similarities = cosine_similarity(user_vec, safe_embeddings)[0]
-        
-        # 3. Rank
-        safe_recipes = safe_recipes.copy()
-        safe_recipes['similarity_score'] = similarities
+        positions, similarities = self.vector_index.search(
+            user_vec, CONSIDERATION_SET_SIZE, safe_mask, self._dislike_penalty(user_profile)
+        )
         
-        return safe_recipes.nlargest(CONSIDERATION_SET_SIZE, 'similarity_score')
+        # 3. Rank: only the final top-k rows are materialized as a DataFrame
+        return self.recipes_df.iloc[positions].assign(similarity_score=similarities)
 
-    def stage_2_ranking_and_explanation(self, user_profile: Dict, candidates: pd.DataFrame) -> List[Dict]:
+    def stage_1_retrieval_batch(self, user_profiles: List[Dict]) -> List[pd.DataFrame]:
         """
-        Stage 2: CoT Reasoning with Rich Candidate Data
+        Batched stage 1 for many personas: all query texts go through one encoder call,
+        personas with the same safe set are scored with one matrix-matrix product and a
+        batched top-k. Returns one candidate frame per persona, in input order. Scores can
+        differ from `stage_1_retrieval` by float rounding (matrix-matrix vs matrix-vector
+        products), which may reorder near-ties at the top-k boundary.
         """
-        # Passing nutritional data allows the LLM to reason about "Muscle Gain" (Protein) or "Weight Loss" (Calories)
-        candidates_json = candidates[[
-            'recipe_id', 'title', 'ingredients_title', 
-            'calories_per_serving [cal]', 
-            'protein_per_serving [g]', 
-            'totalcarbohydrate_per_serving [g]', 
-            'totalfat_per_serving [g]', 
-            'tags'
-        ]].to_dict(orient='records')
-
-        for rec in candidates_json:
-            for key, val in rec.items():
-                if isinstance(val, np.ndarray):
-                    rec[key] = val.tolist()
-              
-        system_prompt = (
-            "You are an AI-powered food recommendation assistant. "
-            "You will receive a list of candidate recipes that has already been filtered by a hard-constraint "
-            "('Never List') module to remove items that violate the user's dietary restrictions and allergies.\n\n"
-        
-            "Your task is to rank the remaining candidates and return the TOP 6 recipes, balancing two goals:\n"
-            "(A) match the user's profile (goal + tastes) and\n"
-            "(B) gently prefer healthier options when it does not significantly reduce profile match.\n\n"
-        
-            "IMPORTANT RULES:\n"
-            "- Do NOT reveal internal reasoning steps.\n"
-            "- Base explanations only on the provided user profile and recipe metadata.\n"
-            "- Do not invent nutrition facts or health claims that are not supported by the provided data.\n"
-            "- Do not provide medical advice.\n\n"
-        
-            "INTERNAL RANKING PRINCIPLES (apply silently):\n"
-            "1. PRIMARY: PROFILE FIT. Prioritize recipes that best match the user's goal and preferences "
-            "(liked ingredients/cuisines, avoid disliked ingredients, dietaryProfile (dietaryRestrictions, foodAllergies, healthConditions)).\n"
-            "2. SECONDARY: HEALTHIER BIAS. When two recipes are similarly good for the user, rank the healthier-leaning one higher "
-            "(e.g., more nutrient-dense, more balanced macros, less excessive sugar/sodium/saturated fat—based only on provided data).\n"
-        
-            "EXPLANATION REQUIREMENTS (user-visible):\n"
-            "- TRANSPARENCY: Explicitly cite at least one user factor that drove the choice (goal or preference). This Transparency aims to evaluate “whether the explanations can reveal the internal working principles of the recommender models\n"
-            "- HEALTH JUSTIFICATION: If the recipe is a healthier-leaning pick (or chosen over a similar option), briefly mention the relevant nutrition cue "
-            "(e.g., 'higher protein', 'more balanced meal', 'includes vegetables/whole grains', 'lower added sugar') without overstating.\n"
-            "- PERSUASIVENESS: Use motivating, non-clinical language that encourages trying the recipe. This Persuasiveness aims to evaluate “whether the explanations can increase the interaction probability of the users on the items.\n"
-            "- Keep each explanation short (3–4 sentences).\n\n"
-        
-            "Output strictly valid JSON in this format:\n"
-            "{ 'recommendations': [ { 'recipe_id': '...', 'explanation': '...' } ] }"
-        )
+        user_vecs = self._encode_queries([self._user_query_text(p) for p in user_profiles])
+
+        groups = {}
+        for i, profile in enumerate(user_profiles):
+            groups.setdefault(self._diet_key(profile), []).append(i)
 
-        user_prompt = f"""
-        User Profile: {json.dumps(user_profile, indent=2)}       
-        Candidates: {json.dumps(candidates_json, indent=2)}
-        """  
-
-        response = self.client.chat.completions.create(
-            model=LLM_MODEL_NAME,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
-            response_format={"type": "json_object"},
-            temperature=0.5
+        results = [None] * len(user_profiles)
+        for members in groups.values():
+            safe_mask = self._apply_hard_constraints(user_profiles[members[0]])
+            if not safe_mask.any():
+                print("Warning: Hard constraints removed all recipes. Relaxing filters...")
+
+            penalties = [self._dislike_penalty(user_profiles[i]) for i in members]
+            hits = self.vector_index.search_batch(user_vecs[members], CONSIDERATION_SET_SIZE, safe_mask, penalties)
+            for i, (positions, similarities) in zip(members, hits):
+                results[i] = self.recipes_df.iloc[positions].assign(similarity_score=similarities)
+        return results
+
+    def local_rerank(self, user_profile: Dict, candidates: pd.DataFrame, top_n: int = LOCAL_RERANK_SIZE) -> pd.DataFrame:
+        """
+        Optional CPU-only pass between the stages: scores the Stage 1 candidates on nutrition
+        vs goal, liked/disliked ingredients and cuisine, and keeps the best `top_n` for the LLM.
+        """
+        if top_n is None or len(candidates) <= top_n:
+            return candidates
+        return local_rerank(candidates, user_profile, self.constraint_index.preference_mask, top_n, LOCAL_RERANK_WEIGHTS)
+
+    def _stage_2_messages(self, user_profile: Dict, candidates: pd.DataFrame) -> tuple:
+        """
+        Builds the chat messages for Stage 2 from the profile and the Stage 1 candidates.
+        Returns (messages, number of candidates included in the prompt).
+        """
+        if PROMPT_FORMAT == "compact":
+            user_prompt, n_included = build_compact_user_prompt(
+                user_profile, candidates, LLM_MODEL_NAME, PROMPT_MAX_INGREDIENTS, PROMPT_TOKEN_BUDGET
+            )
+        else:
+            user_prompt, n_included = build_json_user_prompt(user_profile, candidates)
+
+        return [
+            {"role": "system", "content": STAGE_2_SYSTEM_PROMPT},
+            {"role": "user", "content": user_prompt}
+        ], n_included
+
+    def _request(self, messages: List[Dict], **kwargs):
+        """
+        Sends one chat completion request, paced by the shared rate limiter and retried with
+        exponential backoff on 429/5xx/connection errors. Safe to call from several threads.
+        Returns (response, estimated prompt tokens).
+        """
+        prompt_tokens = sum(estimate_tokens(m["content"]) for m in messages)
+
+        def request():
+            # Every attempt, retries included, counts against the request and token budgets
+            self.rate_limiter.acquire(prompt_tokens + LLM_MAX_OUTPUT_TOKENS_ESTIMATE)
+            return self.client.chat.completions.create(
+                model=LLM_MODEL_NAME,
+                messages=messages,
+                response_format={"type": "json_object"},
+                temperature=0.5,
+                **kwargs
+            )
+
+        response = call_with_retries(
+            request, _is_retryable_llm_error,
+            max_retries=LLM_MAX_RETRIES, base_delay=LLM_BACKOFF_BASE_SECONDS, max_delay=LLM_BACKOFF_MAX_SECONDS
         )
+        return response, prompt_tokens
+
+    def _record_usage(self, usage, estimated_prompt_tokens: int):
+        with self._usage_lock:
+            self.token_usage["requests"] += 1
+            self.token_usage["prompt"] += getattr(usage, "prompt_tokens", None) or estimated_prompt_tokens
+            self.token_usage["completion"] += getattr(usage, "completion_tokens", None) or 0
+
+    def _complete(self, messages: List[Dict]) -> str:
+        """One chat completion; returns the full response text."""
+        response, prompt_tokens = self._request(messages)
+        self._record_usage(getattr(response, "usage", None), prompt_tokens)
+        return response.choices[0].message.content
+
+    def _complete_stream(self, messages: List[Dict]) -> Iterator[str]:
+        """
+        One streamed chat completion; yields text deltas as they arrive. Only opening the
+        stream is retried, since earlier deltas may already have been consumed.
+        """
+        stream, prompt_tokens = self._request(messages, stream=True, stream_options={"include_usage": True})
+        usage = None
+        for chunk in stream:
+            if chunk.usage is not None:
+                usage = chunk.usage
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+        self._record_usage(usage, prompt_tokens)
+
+    def _recipe_card(self, pos: int) -> Dict:
+        """Display fields of the recipe at row `pos`, computed once and reused across requests."""
+        card = self._cards.get(pos)
+        if card is None:
+            row_data = self.recipes_df.iloc[pos]
+            ingredients = row_data.get('ingredients_title', [])
+
+            if isinstance(ingredients, np.ndarray):
+                ingredients = ingredients.tolist()
+
+            card = {
+                "title": row_data['title'],
+                "ingredients": ingredients,
+                "nutrition": {
+                    "calories": float(row_data.get('calories_per_serving [cal]', 0)),
+                    "protein": f"{row_data.get('protein_per_serving [g]', 0)}g",
+                    "carbs": f"{row_data.get('totalcarbohydrate_per_serving [g]', 0)}g",
+                    "fat": f"{row_data.get('totalfat_per_serving [g]', 0)}g"
+                }
+            }
+            self._cards[pos] = card
+        return card
 
+    def _enrich_recommendation(self, rec: Dict, candidate_positions: set) -> Optional[Dict]:
+        """Adds title, ingredients and nutrition to one LLM pick; None if the id is not a candidate."""
+        llm_id = str(rec['recipe_id'])
+        pos = self.recipe_id_to_pos.get(llm_id)
+
+        if pos not in candidate_positions:
+            print(f"⚠️ Warning: LLM returned unknown ID {llm_id}. Skipping.")
+            return None
+
+        card = self._recipe_card(pos)
+        return {
+            "recipe_id": llm_id,
+            "title": card["title"],
+            "explanation": rec['explanation'],
+            "ingredients": list(card["ingredients"]),
+            "nutrition": dict(card["nutrition"])
+        }
+
+    def _parse_stage_2_response(self, content: str, candidates: pd.DataFrame) -> List[Dict]:
         try:
-            content = response.choices[0].message.content
             result = json.loads(content)
-                         
+
+            # Candidate index labels are catalog row positions
+            candidate_positions = set(candidates.index.tolist())
             final_recs = []
             for rec in result.get('recommendations', []):
-                llm_id = str(rec['recipe_id'])
-                # Find the original title
-                original_row = candidates[candidates['recipe_id'].astype(str) == llm_id]
-
-                if not original_row.empty:
-                    row_data = original_row.iloc[0]
-                    ingredients = row_data.get('ingredients_title', [])
-                    
-                    if isinstance(ingredients, np.ndarray):
-                        ingredients = ingredients.tolist()
-
-                    final_recs.append({
-                        "recipe_id": llm_id,
-                        "title": row_data['title'],
-                        "explanation": rec['explanation'],
-                        "ingredients": ingredients,
-                        "nutrition": {
-                            "calories": float(row_data.get('calories_per_serving [cal]', 0)),
-                            "protein": f"{row_data.get('protein_per_serving [g]', 0)}g",
-                            "carbs": f"{row_data.get('totalcarbohydrate_per_serving [g]', 0)}g",
-                            "fat": f"{row_data.get('totalfat_per_serving [g]', 0)}g"
-                        }                       
-                    })
-
-                else:
-                    print(f"⚠️ Warning: LLM returned unknown ID {llm_id}. Skipping.")
+                enriched = self._enrich_recommendation(rec, candidate_positions)
+                if enriched is not None:
+                    final_recs.append(enriched)
 
             return final_recs
             
@@ -244,28 +644,140 @@ class XFoodRecommender:
             print(f"Error in Stage 2: {e}")
             return []
 
-    def run_batch(self, personas: List[Dict]):
-        all_results = []
-        for i, persona in enumerate(personas):
+    def _stage_2_cache_key(self, user_profile: Dict, candidates: pd.DataFrame) -> str:
+        """Identical model, prompt, profile and candidate list -> same response."""
+        key_parts = [LLM_MODEL_NAME, STAGE_2_SYSTEM_PROMPT, user_profile, candidates['recipe_id'].astype(str).tolist()]
+        if PROMPT_FORMAT != "json":
+            key_parts.append([PROMPT_FORMAT, PROMPT_MAX_INGREDIENTS, PROMPT_TOKEN_BUDGET])
+        return self.response_cache.make_key(*key_parts)
 
-            print(f"\nProcessing Persona {i+1}/{len(personas)}: {persona['id']} ({persona['profile']['dietary_goal']})")
+    def _prepare_stage_2_request(self, user_profile: Dict, candidates: pd.DataFrame) -> List[Dict]:
+        messages, n_included = self._stage_2_messages(user_profile, candidates)
+        prompt_tokens = sum(count_tokens(m["content"], LLM_MODEL_NAME) for m in messages)
+        approx = "" if token_counts_are_exact(LLM_MODEL_NAME) else "~"
+        print(f"  Stage 2 prompt: {approx}{prompt_tokens} input tokens ({PROMPT_FORMAT}, {n_included} candidates)")
+        return messages
 
-            candidates = self.stage_1_retrieval(persona['profile'])
-            print(f"  Stage 1: Retrieved {len(candidates)} candidates.")
-            
-            recommendations = self.stage_2_ranking_and_explanation(persona['profile'], candidates)
-            print(f"  Stage 2: Generated {len(recommendations)} final recommendations.")
-            
-            all_results.append({
-                "persona": persona,
-                "recommendations": recommendations
-            })
+    def stage_2_ranking_and_explanation(self, user_profile: Dict, candidates: pd.DataFrame) -> List[Dict]:
+        """
+        Stage 2: CoT Reasoning with Rich Candidate Data
+        """
+        cache_key = self._stage_2_cache_key(user_profile, candidates)
+        content = self.response_cache.get(cache_key)
+        if content is not None:
+            return self._parse_stage_2_response(content, candidates)
+
+        content = self._complete(self._prepare_stage_2_request(user_profile, candidates))
+        final_recs = self._parse_stage_2_response(content, candidates)
+        if final_recs:
+            self.response_cache.put(cache_key, content)
+        return final_recs
+
+    def stage_2_stream(self, user_profile: Dict, candidates: pd.DataFrame) -> Iterator[Dict]:
+        """
+        Streaming variant of stage_2_ranking_and_explanation: yields each enriched
+        recommendation as soon as the LLM has finished writing it, so a UI can render the
+        first card while the rest are still being generated. Cached responses are replayed.
+        """
+        cache_key = self._stage_2_cache_key(user_profile, candidates)
+        content = self.response_cache.get(cache_key)
+        if content is not None:
+            yield from self._parse_stage_2_response(content, candidates)
+            return
+
+        parser = RecommendationStreamParser()
+        candidate_positions = set(candidates.index.tolist())
+        n_yielded = 0
+        try:
+            for delta in self._complete_stream(self._prepare_stage_2_request(user_profile, candidates)):
+                for rec in parser.feed(delta):
+                    enriched = self._enrich_recommendation(rec, candidate_positions)
+                    if enriched is not None:
+                        n_yielded += 1
+                        yield enriched
+        except Exception as e:
+            print(f"Error in Stage 2: {e}")
+            return
+
+        if n_yielded:
+            self.response_cache.put(cache_key, parser.text)
+
+    def run_batch(self, personas: List[Dict], max_workers: int = LLM_MAX_CONCURRENCY, resume: bool = False):
+        """
+        Stage 1 runs batched on the main thread, one chunk of personas at a time; the chunk's
+        Stage 2 LLM calls then run concurrently on `max_workers` threads, paced by the shared
+        rate limiter.
+
+        Each result is appended to RECOMMENDATIONS_STREAM_FILE (JSONL) as soon as it and all
+        earlier personas are done, so the log is always an in-order prefix of the batch.
+        With `resume=True`, personas whose id is already in the log are skipped.
+        RECOMMENDATIONS_FILE is produced from the log at the end.
+        """
+        done_ids = set()
+        if resume:
+            done_ids = {record['persona']['id'] for record in read_jsonl(RECOMMENDATIONS_STREAM_FILE)}
+            print(f"Resuming: {len(done_ids)} personas already in {RECOMMENDATIONS_STREAM_FILE}.")
+        todo = [p for p in personas if p['id'] not in done_ids]
+
+        with JsonlWriter(RECOMMENDATIONS_STREAM_FILE, append=resume) as writer, \
+                ThreadPoolExecutor(max_workers=max_workers) as pool:
+            for start in range(0, len(todo), STAGE1_BATCH_SIZE):
+                chunk = todo[start:start + STAGE1_BATCH_SIZE]
+                chunk_candidates = self.stage_1_retrieval_batch([p['profile'] for p in chunk])
+
+                futures = {}
+                for i, (persona, candidates) in enumerate(zip(chunk, chunk_candidates)):
+                    print(f"\nProcessing Persona {start+i+1}/{len(todo)}: {persona['id']} ({persona['profile']['dietary_goal']})")
+                    print(f"  Stage 1: Retrieved {len(candidates)} candidates.")
+                    if LOCAL_RERANK_SIZE is not None:
+                        candidates = self.local_rerank(persona['profile'], candidates)
+                        print(f"  Local rerank: Kept {len(candidates)} candidates.")
+                    future = pool.submit(self.stage_2_ranking_and_explanation, persona['profile'], candidates)
+                    futures[future] = i
+
+                # Out-of-order completions wait here until every earlier persona is written
+                pending, next_to_write = {}, 0
+                for future in as_completed(futures):
+                    i = futures[future]
+                    recommendations = future.result()
+                    print(f"  Stage 2 ({chunk[i]['id']}): Generated {len(recommendations)} final recommendations.")
+
+                    pending[i] = {
+                        "persona": chunk[i],
+                        "recommendations": recommendations
+                    }
+                    while next_to_write in pending:
+                        writer.write(pending.pop(next_to_write))
+                        next_to_write += 1
 
-        with open(RECOMMENDATIONS_FILE, 'w') as f:
-            json.dump(all_results, f, indent=2)
-        print(f"\nSaved full results to {RECOMMENDATIONS_FILE}")
+        count = convert_jsonl_to_json(RECOMMENDATIONS_STREAM_FILE, RECOMMENDATIONS_FILE)
+        print(f"\nSaved full results ({count} personas) to {RECOMMENDATIONS_FILE}")
+
+        if QUERY_CACHE_PERSIST:
+            self.query_cache.save(QUERY_CACHE_FILE)
+
+        usage = self.token_usage
+        if usage["requests"]:
+            print(f"Stage 2 tokens: {usage['prompt']} prompt + {usage['completion']} completion "
+                  f"over {usage['requests']} requests ({usage['prompt'] // usage['requests']} prompt tokens/request)")
+
+        caches = (("Safe-set", self.safe_set_cache), ("Query embedding", self.query_cache), ("LLM response", self.response_cache))
+        for name, cache in caches:
+            stats = cache.stats()
+            if not stats.get('enabled', True):
+                continue
+            print(f"{name} cache: {stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate']:.0%} hit rate)")
 
 def main():
+    parser = argparse.ArgumentParser(description="Step 2: Hybrid Retrieval + LLM Reranking & Explanation.")
+    parser.add_argument("--resume", action="store_true",
+                        help=f"Skip personas already present in {RECOMMENDATIONS_STREAM_FILE.name}")
+    parser.add_argument("--concurrency", type=int, default=LLM_MAX_CONCURRENCY,
+                        help="Parallel Stage 2 LLM requests")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Bypass the Stage 2 LLM response cache (always call the API)")
+    args = parser.parse_args()
+
     if not PERSONAS_FILE.exists():
         print("Please run Step 1 (Persona Generator) first.")
         return
@@ -273,8 +785,8 @@ def main():
     with open(PERSONAS_FILE, 'r') as f:
         personas = json.load(f)
 
-    engine = XFoodRecommender()
-    engine.run_batch(personas)
+    engine = XFoodRecommender(use_response_cache=LLM_CACHE_ENABLED and not args.no_cache)
+    engine.run_batch(personas, max_workers=args.concurrency, resume=args.resume)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
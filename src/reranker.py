@@ -0,0 +1,102 @@
+import numpy as np
+import pandas as pd
+from typing import Callable, Dict, List
+
+from constraint_index import preference_term
+
+# Nutrition features (z-scored within the candidate set) favoured per dietary goal.
+# Goals are matched by substring of the lowercased `dietary_goal`; anything else uses "maintenance".
+GOAL_NUTRITION_WEIGHTS = {
+    "weight loss": {"kcal": -1.0, "protein_share": 0.5, "fat_share": -0.25},
+    "muscle gain": {"protein_g": 1.0, "protein_share": 0.5},
+    "energy boost": {"carbs_share": 0.75, "fat_share": -0.25},
+    "medical management": {"macro_imbalance": -0.5, "fat_share": -0.5},
+    "maintenance": {"macro_imbalance": -1.0},
+}
+# Share of energy from protein / carbohydrate / fat considered balanced
+BALANCED_MACRO_SHARES = np.array([0.2, 0.5, 0.3])
+
+
+def _zscore(values: np.ndarray) -> np.ndarray:
+    std = values.std()
+    return (values - values.mean()) / std if std > 0 else np.zeros_like(values)
+
+
+def _numeric(candidates: pd.DataFrame, column: str) -> np.ndarray:
+    """Column as float64; missing values become the candidate median (neutral after z-scoring)."""
+    if column not in candidates.columns:
+        return np.zeros(len(candidates))
+    values = pd.to_numeric(candidates[column], errors='coerce').to_numpy(dtype=np.float64)
+    missing = np.isnan(values)
+    if missing.any():
+        values[missing] = np.nanmedian(values) if not missing.all() else 0.0
+    return values
+
+
+def nutrition_features(candidates: pd.DataFrame) -> Dict[str, np.ndarray]:
+    kcal = _numeric(candidates, 'calories_per_serving [cal]')
+    protein = _numeric(candidates, 'protein_per_serving [g]')
+    carbs = _numeric(candidates, 'totalcarbohydrate_per_serving [g]')
+    fat = _numeric(candidates, 'totalfat_per_serving [g]')
+
+    energy = np.stack([4 * protein, 4 * carbs, 9 * fat], axis=1)
+    total = energy.sum(axis=1, keepdims=True)
+    shares = np.divide(energy, total, out=np.tile(BALANCED_MACRO_SHARES, (len(energy), 1)), where=total > 0)
+    return {
+        "kcal": kcal,
+        "protein_g": protein,
+        "protein_share": shares[:, 0],
+        "carbs_share": shares[:, 1],
+        "fat_share": shares[:, 2],
+        "macro_imbalance": np.abs(shares - BALANCED_MACRO_SHARES).sum(axis=1),
+    }
+
+
+def goal_weights(goal: str) -> Dict[str, float]:
+    goal = (goal or "").lower()
+    for name, weights in GOAL_NUTRITION_WEIGHTS.items():
+        if name in goal:
+            return weights
+    return GOAL_NUTRITION_WEIGHTS["maintenance"]
+
+
+def _term_hits(terms: List[str], positions: np.ndarray, preference_mask: Callable[[str], np.ndarray]) -> np.ndarray:
+    """Number of `terms` found in each candidate's ingredients."""
+    hits = np.zeros(len(positions))
+    for term in {preference_term(t) for t in terms if t and t.strip()}:
+        hits += preference_mask(term)[positions]
+    return hits
+
+
+def rerank_scores(candidates: pd.DataFrame, profile: Dict, preference_mask: Callable[[str], np.ndarray],
+                  weights: Dict[str, float]) -> np.ndarray:
+    """
+    Cheap profile-fit score per candidate: Stage 1 similarity, nutrition vs `dietary_goal`,
+    liked/disliked ingredient overlap and favourite-cuisine match. `preference_mask(term)` is
+    a catalog-wide whole-word ingredient mask (ConstraintIndex.preference_mask); candidate
+    index labels are catalog positions.
+    """
+    positions = candidates.index.to_numpy()
+    features = nutrition_features(candidates)
+    nutrition = sum(w * _zscore(features[name]) for name, w in goal_weights(profile.get('dietary_goal')).items())
+
+    titles = candidates['title'].astype(str).str.lower()
+    cuisine = np.zeros(len(candidates))
+    for c in {c.strip().lower() for c in profile.get('favoriteCuisines', []) if c and c.strip()}:
+        cuisine = np.maximum(cuisine, titles.str.contains(c, regex=False).to_numpy() | preference_mask(c)[positions])
+
+    return (
+        weights.get("similarity", 0.0) * _zscore(_numeric(candidates, 'similarity_score')) +
+        weights.get("nutrition", 0.0) * _zscore(nutrition) +
+        weights.get("liked", 0.0) * _term_hits(profile.get('likedIngredients', []), positions, preference_mask) +
+        weights.get("disliked", 0.0) * _term_hits(profile.get('dislikedIngredients', []), positions, preference_mask) +
+        weights.get("cuisine", 0.0) * cuisine
+    )
+
+
+def local_rerank(candidates: pd.DataFrame, profile: Dict, preference_mask: Callable[[str], np.ndarray],
+                 top_n: int, weights: Dict[str, float]) -> pd.DataFrame:
+    """The `top_n` best candidates by `rerank_scores`, best first (ties keep Stage 1 order)."""
+    scores = rerank_scores(candidates, profile, preference_mask, weights)
+    order = np.argsort(-scores, kind="stable")[:top_n]
+    return candidates.iloc[order].assign(rerank_score=scores[order])
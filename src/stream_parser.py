@@ -0,0 +1,53 @@
+import json
+from typing import Dict, Iterator
+
+
+class RecommendationStreamParser:
+    """
+    Incremental parser for a streamed `{"recommendations": [{...}, {...}]}` completion.
+    Feed it text chunks as they arrive; each recommendation object is returned as soon
+    as its closing brace has been received. Braces inside strings are ignored.
+    """
+
+    # Depth of an object that sits directly in the top-level object's array
+    ITEM_DEPTH = 2
+
+    def __init__(self):
+        self.buffer = []
+        self._item = []
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+
+    def feed(self, chunk: str) -> Iterator[Dict]:
+        self.buffer.append(chunk)
+        for ch in chunk:
+            if self._depth > self.ITEM_DEPTH:
+                self._item.append(ch)
+
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif ch == "\\":
+                    self._escaped = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                if self._depth == self.ITEM_DEPTH and ch == "{":
+                    self._item = [ch]
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+                if self._depth == self.ITEM_DEPTH and ch == "}":
+                    text, self._item = "".join(self._item), []
+                    try:
+                        yield json.loads(text)
+                    except json.JSONDecodeError:
+                        print(f"⚠️ Warning: Skipping unparseable streamed recommendation: {text[:80]}")
+
+    @property
+    def text(self) -> str:
+        """Everything received so far."""
+        return "".join(self.buffer)
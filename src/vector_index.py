@@ -0,0 +1,497 @@
+import numpy as np
+from pathlib import Path
+from typing import List, NamedTuple, Optional, Tuple, Union
+
+# Below this fraction of allowed rows, gathering the masked rows is cheaper than a full mat-vec
+GATHER_THRESHOLD = 0.25
+
+
+def l2_normalize(x: np.ndarray) -> np.ndarray:
+    """Row-wise L2 normalization, so that cosine similarity is a plain dot product."""
+    x = np.asarray(x, dtype=np.float32)
+    norms = np.linalg.norm(x, axis=-1, keepdims=True)
+    return x / np.maximum(norms, 1e-12)
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    Indices of the k best scores, best first, in O(N) via argpartition. Ties keep the
+    lower index first (like DataFrame.nlargest), including ties straddling the cut-off.
+    """
+    if k <= 0 or len(scores) == 0:
+        return np.empty(0, dtype=np.int64)
+    if k < len(scores):
+        kth = scores[np.argpartition(-scores, k - 1)[:k]].min()
+        candidates = np.flatnonzero(scores >= kth)
+    else:
+        candidates = np.arange(len(scores))
+    order = np.lexsort((candidates, -scores[candidates]))
+    return candidates[order[:k]]
+
+
+def top_k_batch(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    Row-wise `top_k` for a (queries x rows) score matrix with a single argpartition call.
+    Rows with ties straddling the cut-off are redone with `top_k` to keep identical results.
+    """
+    n_queries, n_rows = scores.shape
+    k = min(k, n_rows)
+    if k <= 0:
+        return np.empty((n_queries, 0), dtype=np.int64)
+    if k < n_rows:
+        part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        part = np.broadcast_to(np.arange(n_rows), scores.shape)
+    part_scores = np.take_along_axis(scores, part, axis=1)
+    best = np.take_along_axis(part, np.lexsort((part, -part_scores)), axis=1)
+
+    kth = part_scores.min(axis=1, keepdims=True)
+    for row in np.flatnonzero((scores >= kth).sum(axis=1) > k):
+        best[row] = top_k(scores[row], k)
+    return best
+
+
+class SparseBias(NamedTuple):
+    """
+    Per-row score bias that is zero except at `positions` (sorted, unique row positions),
+    e.g. a penalty on the recipes containing a disliked ingredient. Costs memory per biased
+    row instead of per catalog row.
+    """
+    positions: np.ndarray
+    values: np.ndarray
+
+    @classmethod
+    def from_dense(cls, bias: np.ndarray) -> "SparseBias":
+        positions = np.flatnonzero(bias)
+        return cls(positions, np.asarray(bias[positions], dtype=np.float32))
+
+    def restrict(self, rows: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """(indices into the sorted `rows`, bias values) for the biased rows among `rows`."""
+        idx = np.searchsorted(rows, self.positions)
+        found = idx < len(rows)
+        found[found] = rows[idx[found]] == self.positions[found]
+        return idx[found], self.values[found]
+
+    def at(self, rows: np.ndarray) -> np.ndarray:
+        """Bias values of arbitrary `rows`."""
+        out = np.zeros(len(rows), dtype=np.float32)
+        if len(self.positions):
+            idx = np.minimum(np.searchsorted(self.positions, rows), len(self.positions) - 1)
+            hit = self.positions[idx] == rows
+            out[hit] = self.values[idx[hit]]
+        return out
+
+
+# A bias is given either densely (one value per row) or as a SparseBias
+Bias = Union[np.ndarray, SparseBias]
+
+
+def _as_sparse(bias: Optional[Bias]) -> Optional[SparseBias]:
+    if bias is None or isinstance(bias, SparseBias):
+        return bias
+    return SparseBias.from_dense(bias)
+
+
+def _add_biases(scores: np.ndarray, biases: List[Optional[SparseBias]], rows: Optional[np.ndarray]) -> list:
+    """
+    Adds each query's bias to its row of the (queries x rows) score matrix in place, where
+    the columns are `rows` (or every row). Returns what `_restore_scores` needs to undo it.
+    """
+    saved = []
+    for query_scores, bias in zip(scores, biases):
+        if bias is None:
+            saved.append(None)
+            continue
+        idx, values = (bias.positions, bias.values) if rows is None else bias.restrict(rows)
+        saved.append((idx, query_scores[idx].copy()))
+        query_scores[idx] += values
+    return saved
+
+
+def _restore_scores(query_scores: np.ndarray, saved):
+    """Puts back the unbiased scores of one query, so results carry plain cosine scores."""
+    if saved is not None:
+        idx, original = saved
+        query_scores[idx] = original
+
+
+class FlatIndex:
+    """
+    Exact search: scores every row allowed by the mask. This is the reference path.
+    Expects L2-normalized embeddings; one mat-vec product + argpartition per query.
+    """
+    kind = "flat"
+
+    def __init__(self, embeddings: np.ndarray):
+        self.embeddings = embeddings
+
+    def search(self, query: np.ndarray, k: int, mask: Optional[np.ndarray] = None,
+               bias: Optional[Bias] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns (row positions, cosine scores) of the top-k rows where mask is True.
+        `bias` (per row, e.g. a negative penalty; dense or SparseBias) is added to the cosine
+        scores for ranking only; the returned scores are the plain cosine similarities.
+        """
+        q = l2_normalize(query.reshape(-1))
+        bias = _as_sparse(bias)
+
+        if mask is not None and mask.mean() < GATHER_THRESHOLD:
+            rows = np.flatnonzero(mask)
+            scores = self.embeddings[rows] @ q
+            ranking = scores
+            if bias is not None:
+                idx, values = bias.restrict(rows)
+                ranking = scores.copy()
+                ranking[idx] += values
+            best = top_k(ranking, k)
+            return rows[best], scores[best]
+
+        scores = self.embeddings @ q
+        ranking = scores
+        if bias is not None:
+            ranking = scores.copy()
+            ranking[bias.positions] += bias.values
+        if mask is not None:
+            ranking[~mask] = -np.inf
+        best = top_k(ranking, k)
+        best = best[np.isfinite(ranking[best])]
+        return best, scores[best]
+
+    def search_batch(self, queries: np.ndarray, k: int, mask: Optional[np.ndarray] = None,
+                     biases: Optional[List[Optional[Bias]]] = None) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """
+        `search` for many queries sharing one mask: one mat-mat product and one batched top-k.
+        `biases` optionally holds one bias (or None) per query.
+        Returns a (row positions, scores) pair per query.
+        """
+        q = l2_normalize(queries)
+        rows = None
+        if mask is not None and mask.mean() < GATHER_THRESHOLD:
+            rows = np.flatnonzero(mask)
+            scores = q @ self.embeddings[rows].T
+        else:
+            scores = q @ self.embeddings.T
+            if mask is not None:
+                scores[:, ~mask] = -np.inf
+
+        # Biases are added in place (no second score matrix) and undone before reading the results
+        saved = _add_biases(scores, [_as_sparse(b) for b in biases or [None] * len(q)], rows)
+
+        results = []
+        for query_scores, query_saved, best in zip(scores, saved, top_k_batch(scores, k)):
+            _restore_scores(query_scores, query_saved)
+            if rows is None:
+                best = best[np.isfinite(query_scores[best])]
+            results.append((best if rows is None else rows[best], query_scores[best]))
+        return results
+
+    def update(self, embeddings: np.ndarray, positions: np.ndarray):
+        self.embeddings = embeddings
+
+    def compact(self, embeddings: np.ndarray, keep: np.ndarray):
+        """Switches to `embeddings`, which hold only the rows `keep` of the old ones."""
+        self.embeddings = embeddings
+
+    def save(self, path: Path, fingerprint: str):
+        pass  # Nothing to persist beyond the embeddings themselves
+
+    @classmethod
+    def load(cls, path: Path, embeddings: np.ndarray, fingerprint: str):
+        return cls(embeddings)
+
+
+class IVFIndex:
+    """
+    Inverted-file index: rows are bucketed by their nearest k-means centroid and a query
+    only scores the `n_probe` closest buckets. Recall/latency is tuned via `n_probe`.
+    Expects L2-normalized embeddings, like FlatIndex.
+
+    The hard-constraint mask is applied *before* scoring (pre-filter). If the probed buckets
+    hold fewer than k allowed rows, more buckets are probed until k rows are found.
+    """
+    kind = "ivf"
+
+    def __init__(self, embeddings: np.ndarray, n_lists: Optional[int] = None, n_probe: int = 8,
+                 n_iter: int = 10, seed: int = 0, train: bool = True):
+        self.embeddings = embeddings
+        self.n_probe = n_probe
+        self.n_lists = self.resolve_n_lists(n_lists, len(embeddings))
+        self.centroids = None
+        self.assignments = None
+        self.lists = []
+        if train:
+            self._train(n_iter, seed)
+
+    @staticmethod
+    def resolve_n_lists(n_lists: Optional[int], n_rows: int) -> int:
+        """Bucket count actually used for `n_rows` rows (None = sqrt(n_rows))."""
+        return min(n_lists or max(1, int(np.sqrt(n_rows))), max(n_rows, 1))
+
+    def _train(self, n_iter: int, seed: int):
+        """Spherical k-means on (a sample of) the normalized embeddings."""
+        data = self.embeddings
+        rng = np.random.default_rng(seed)
+        n_lists = self.n_lists
+        sample = data[rng.choice(len(data), size=min(len(data), 256 * n_lists), replace=False)]
+        centroids = sample[rng.choice(len(sample), size=n_lists, replace=False)]
+
+        for _ in range(n_iter):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            for c in range(n_lists):
+                members = sample[labels == c]
+                if len(members):
+                    centroids[c] = members.mean(axis=0)
+            centroids = l2_normalize(centroids)
+
+        self.centroids = centroids
+        self._set_assignments(np.argmax(data @ centroids.T, axis=1))
+
+    def _set_assignments(self, assignments: np.ndarray):
+        """Builds the per-bucket row lists from a row -> bucket array."""
+        self.assignments = assignments
+        order = np.argsort(assignments, kind="stable")
+        bounds = np.searchsorted(assignments[order], np.arange(self.n_lists + 1))
+        self.lists = [order[bounds[c]:bounds[c + 1]] for c in range(self.n_lists)]
+
+    def search(self, query: np.ndarray, k: int, mask: Optional[np.ndarray] = None,
+               bias: Optional[Bias] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns (row positions, cosine scores) of the approximate top-k rows where mask is True.
+        `bias` is added to the scores for ranking only, as in FlatIndex.search.
+        """
+        q = l2_normalize(query.reshape(-1))
+        probe_order = np.argsort(-(self.centroids @ q))
+
+        n_probe = min(self.n_probe, self.n_lists)
+        while True:
+            rows = np.concatenate([self.lists[c] for c in probe_order[:n_probe]])
+            if mask is not None:
+                rows = rows[mask[rows]]
+            if len(rows) >= k or n_probe >= self.n_lists:
+                break
+            n_probe = min(self.n_lists, n_probe * 2)
+
+        if len(rows) == 0:
+            return rows, np.empty(0, dtype=np.float32)
+        rows = np.sort(rows)  # Keep tie-breaking identical to the flat path
+        scores = self.embeddings[rows] @ q
+        ranking = scores
+        bias = _as_sparse(bias)
+        if bias is not None:
+            idx, values = bias.restrict(rows)
+            ranking = scores.copy()
+            ranking[idx] += values
+        best = top_k(ranking, k)
+        return rows[best], scores[best]
+
+    def search_batch(self, queries: np.ndarray, k: int, mask: Optional[np.ndarray] = None,
+                     biases: Optional[List[Optional[Bias]]] = None) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """Probed buckets differ per query, so this is a loop over `search`."""
+        return [self.search(q, k, mask, None if biases is None else biases[i]) for i, q in enumerate(queries)]
+
+    def update(self, embeddings: np.ndarray, positions: np.ndarray):
+        """Re-buckets only the given rows (new or changed); cost scales with the delta."""
+        self.embeddings = embeddings
+        positions = np.asarray(positions, dtype=np.int64)
+        if len(positions) == 0:
+            return
+        new_labels = np.argmax(embeddings[positions] @ self.centroids.T, axis=1)
+
+        grown = len(embeddings) - len(self.assignments)
+        if grown > 0:
+            self.assignments = np.concatenate([self.assignments, np.full(grown, -1, dtype=np.int64)])
+        old_labels = self.assignments[positions]
+
+        for c in np.unique(old_labels[old_labels >= 0]):
+            self.lists[c] = self.lists[c][~np.isin(self.lists[c], positions[old_labels == c])]
+        for c in np.unique(new_labels):
+            self.lists[c] = np.concatenate([self.lists[c], positions[new_labels == c]])
+        self.assignments[positions] = new_labels
+
+    def compact(self, embeddings: np.ndarray, keep: np.ndarray):
+        """Keeps only the rows `keep` (renumbered from 0) in their buckets; no retraining."""
+        self.embeddings = embeddings
+        self._set_assignments(self.assignments[keep])
+
+    def save(self, path: Path, fingerprint: str):
+        """`fingerprint` identifies the embeddings (see `EmbeddingStore.fingerprint`)."""
+        with open(path, "wb") as f:
+            np.savez(
+                f,
+                centroids=self.centroids,
+                assignments=self.assignments,
+                n_lists=self.n_lists,
+                n_probe=self.n_probe,
+                fingerprint=fingerprint,
+            )
+
+    @classmethod
+    def load(cls, path: Path, embeddings: np.ndarray, fingerprint: str, n_lists: Optional[int] = None):
+        """
+        Loads a persisted index, or returns None if it was saved with a different
+        fingerprint (other embeddings) or a different `n_lists`.
+        """
+        with np.load(path) as data:
+            if str(data["fingerprint"]) != fingerprint:
+                return None
+            n_lists = cls.resolve_n_lists(n_lists, len(embeddings))
+            if "n_lists" not in data.files or int(data["n_lists"]) != n_lists:
+                return None
+            index = cls(embeddings, n_lists=n_lists, n_probe=int(data["n_probe"]), train=False)
+            index.centroids = data["centroids"]
+            index._set_assignments(data["assignments"])
+        return index
+
+
+def quantize_embeddings(embeddings: np.ndarray, quantization: str) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """
+    Compact copy of (normalized) embeddings: "float16", or "int8" codes with one float32
+    scale per row (x ~= codes * scale). Returns (codes, scales); scales is None for float16.
+    """
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    if quantization == "float16":
+        return embeddings.astype(np.float16), None
+    if quantization == "int8":
+        scales = np.abs(embeddings).max(axis=1) / 127
+        scales[scales == 0] = 1
+        codes = np.rint(embeddings / scales[:, None]).astype(np.int8)
+        return codes, scales.astype(np.float32)
+    raise ValueError(f"Unknown quantization '{quantization}'. Choose from ['float16', 'int8'].")
+
+
+class QuantizedFlatIndex:
+    """
+    Exact-scan search over a quantized copy of the embeddings (float16: half, int8: about a
+    quarter of the float32 size). Blocks of rows are widened to float32 just for scoring, so
+    the full float32 matrix is never needed in RAM.
+
+    With `rescore=True`, the best `k * rescore_factor` approximate hits are re-ranked with
+    the float32 embeddings, which are typically the memory-mapped cache file: only those
+    rows are read. Otherwise approximate cosine scores are returned. Inserting recipes or
+    compacting the live catalog copies the float32 rows into RAM until the next restart
+    (see `XFoodRecommender._reserve_embedding_rows`).
+    """
+    kind = "quantized"
+
+    def __init__(self, embeddings: np.ndarray, quantization: str = "int8", rescore: bool = True,
+                 rescore_factor: int = 4, block_rows: int = 2048):
+        self.embeddings = embeddings
+        self.quantization = quantization
+        self.rescore = rescore
+        self.rescore_factor = rescore_factor
+        self.block_rows = block_rows
+        self.codes, self.scales = quantize_embeddings(embeddings, quantization)
+
+    @property
+    def nbytes(self) -> int:
+        """Resident size of the compact representation."""
+        return self.codes.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    def _approx_scores(self, q: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """(queries x rows) approximate cosine scores, computed block by block."""
+        n = len(self.codes) if rows is None else len(rows)
+        scores = np.empty((len(q), n), dtype=np.float32)
+        for start in range(0, n, self.block_rows):
+            stop = min(n, start + self.block_rows)
+            sel = slice(start, stop) if rows is None else rows[start:stop]
+            scores[:, start:stop] = q @ self.codes[sel].astype(np.float32).T
+            if self.scales is not None:
+                scores[:, start:stop] *= self.scales[sel]
+        return scores
+
+    def search(self, query: np.ndarray, k: int, mask: Optional[np.ndarray] = None,
+               bias: Optional[Bias] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Same contract as FlatIndex.search."""
+        return self.search_batch(query.reshape(1, -1), k, mask, None if bias is None else [bias])[0]
+
+    def search_batch(self, queries: np.ndarray, k: int, mask: Optional[np.ndarray] = None,
+                     biases: Optional[List[Optional[Bias]]] = None) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """Same contract as FlatIndex.search_batch."""
+        q = l2_normalize(queries)
+        rows = None
+        if mask is not None and mask.mean() < GATHER_THRESHOLD:
+            rows = np.flatnonzero(mask)
+        scores = self._approx_scores(q, rows)
+        if rows is None and mask is not None:
+            scores[:, ~mask] = -np.inf
+
+        biases = [_as_sparse(b) for b in biases or [None] * len(q)]
+        saved = _add_biases(scores, biases, rows)
+
+        n_candidates = k * self.rescore_factor if self.rescore else k
+        results = []
+        for query, query_scores, bias, query_saved, best in zip(
+                q, scores, biases, saved, top_k_batch(scores, n_candidates)):
+            _restore_scores(query_scores, query_saved)
+            best = best[np.isfinite(query_scores[best])]
+            positions = best if rows is None else rows[best]
+            if not self.rescore:
+                results.append((positions, query_scores[best]))
+                continue
+            # Ascending positions keep tie-breaking identical to the float32 flat index
+            positions = np.sort(positions)
+            exact = self.embeddings[positions] @ query
+            ranking = exact if bias is None else exact + bias.at(positions)
+            top = top_k(ranking, k)
+            results.append((positions[top], exact[top]))
+        return results
+
+    def update(self, embeddings: np.ndarray, positions: np.ndarray):
+        """Re-quantizes only the given (changed or appended) rows."""
+        self.embeddings = embeddings
+        positions = np.asarray(positions, dtype=np.int64)
+        if len(positions) == 0:
+            return
+        grown = len(embeddings) - len(self.codes)
+        if grown > 0:
+            self.codes = np.concatenate([self.codes, np.zeros((grown, self.codes.shape[1]), dtype=self.codes.dtype)])
+            if self.scales is not None:
+                self.scales = np.concatenate([self.scales, np.ones(grown, dtype=np.float32)])
+        codes, scales = quantize_embeddings(embeddings[positions], self.quantization)
+        self.codes[positions] = codes
+        if scales is not None:
+            self.scales[positions] = scales
+
+    def compact(self, embeddings: np.ndarray, keep: np.ndarray):
+        """Keeps only the codes of rows `keep` (renumbered from 0)."""
+        self.embeddings = embeddings
+        self.codes = self.codes[keep]
+        if self.scales is not None:
+            self.scales = self.scales[keep]
+
+    def save(self, path: Path, fingerprint: str):
+        pass  # Quantizing at load time takes well under a second per million rows
+
+    @classmethod
+    def load(cls, path: Path, embeddings: np.ndarray, fingerprint: str):
+        return None
+
+
+INDEX_TYPES = {"flat": FlatIndex, "ivf": IVFIndex, "quantized": QuantizedFlatIndex}
+
+
+def build_index(kind: str, embeddings: np.ndarray, path: Optional[Path] = None,
+                fingerprint: Optional[str] = None, **params):
+    """
+    Returns an index of the given kind over `embeddings`. If `path` and the embeddings'
+    `fingerprint` (e.g. `EmbeddingStore.fingerprint`) are given and the kind is "ivf" (the
+    only one worth persisting), a saved index with the same fingerprint is reused, otherwise
+    a new one is built and saved there.
+    """
+    if kind not in INDEX_TYPES:
+        raise ValueError(f"Unknown vector index type '{kind}'. Choose from {list(INDEX_TYPES)}.")
+    index_cls = INDEX_TYPES[kind]
+
+    persist = path is not None and fingerprint is not None and kind == "ivf"
+    if persist and Path(path).exists():
+        index = index_cls.load(path, embeddings, fingerprint, n_lists=params.get("n_lists"))
+        if index is not None:
+            if "n_probe" in params:
+                index.n_probe = params["n_probe"]
+            print(f"Loaded {kind} vector index from {path}.")
+            return index
+
+    index = index_cls(embeddings, **params)
+    if persist:
+        index.save(path, fingerprint)
+    return index